@@ -6,8 +6,8 @@ import os
 import ssl
 from typing import List, Optional, Tuple, Dict, Any
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from pydantic_settings import BaseSettings
-import pytz
 
 class Settings(BaseSettings):
     """Application settings"""
@@ -26,23 +26,30 @@ class Settings(BaseSettings):
     
     # Database configuration
     DATABASE_URL: str = "sqlite:///./ocpp_cms.db"
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_RECYCLE: int = 1800  # seconds before a pooled connection is replaced
     
     # Redis configuration (for message queue and caching)
     REDIS_URL: str = "redis://localhost:6379/0"
+    RFID_STATUS_CACHE_TTL: int = 10  # seconds an RFID authorization status stays cached
     
     # JWT configuration
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    BCRYPT_ROUNDS: int = 12  # bcrypt work factor for user password hashes
     
     # OCPP configuration
     OCPP_WEBSOCKET_HOST: str = "0.0.0.0"
     OCPP_WEBSOCKET_PORT: int = 1025
     OCPP_SUBPROTOCOLS: List[str] = ["ocpp1.6", "ocpp2.0.1"]
+    OCPP_BATCH_WRITES: bool = True  # cork the TCP socket while a charger writer flushes a burst of frames
     
     # Message queue configuration
     MQ_BROKER_URL: str = "redis://localhost:6379/1"
     MQ_EXCHANGE: str = "ocpp_events"
+    MQ_REDIS_ENCODING: str = "json"  # "json" or "msgpack" for events/responses pushed to Redis
     
     # Logging configuration
     LOG_LEVEL: str = "INFO"
@@ -51,6 +58,7 @@ class Settings(BaseSettings):
     # Laravel CMS integration
     LARAVEL_API_URL: str = "http://localhost:8080/api"
     LARAVEL_API_KEY: str = "your-laravel-api-key"
+    CMS_HTTP_CLIENT: str = "aiohttp"  # "aiohttp" or "httpx" (HTTP/2 uplink, needs httpx[http2])
     
     # Charger configuration
     HEARTBEAT_INTERVAL: int = 60
@@ -162,8 +170,9 @@ def get_uvicorn_ssl_kwargs() -> Dict[str, Any]:
     
     return kwargs
 
-# Egypt timezone configuration
-EGYPT_TZ = pytz.timezone('Africa/Cairo')
+# Egypt timezone configuration (zoneinfo is resolved once here; its offset
+# lookups are done in C, unlike pytz's Python-level fromutc)
+EGYPT_TZ = ZoneInfo('Africa/Cairo')
 
 def get_egypt_now() -> datetime:
     """
@@ -172,12 +181,8 @@ def get_egypt_now() -> datetime:
     """
     return datetime.now(EGYPT_TZ)
 
-def get_egypt_utcnow() -> datetime:
-    """
-    Get current datetime in Egypt timezone (Africa/Cairo).
-    Alias for get_egypt_now() for backward compatibility.
-    """
-    return get_egypt_now()
+# Alias for get_egypt_now() for backward compatibility
+get_egypt_utcnow = get_egypt_now
 
 def to_egypt_timezone(dt: datetime) -> datetime:
     """
@@ -187,7 +192,7 @@ def to_egypt_timezone(dt: datetime) -> datetime:
     """
     if dt.tzinfo is None:
         # Naive datetime - assume it's in Egypt timezone
-        return EGYPT_TZ.localize(dt)
+        return dt.replace(tzinfo=EGYPT_TZ)
     else:
         # Timezone-aware datetime - convert to Egypt timezone
         return dt.astimezone(EGYPT_TZ)
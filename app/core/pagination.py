@@ -0,0 +1,29 @@
+"""
+Keyset (cursor) pagination helpers for list endpoints
+"""
+
+from datetime import datetime
+from typing import Optional, Tuple
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(created_at: Optional[datetime], row_id: int) -> Optional[str]:
+    """Encode the (created_at, id) position of the last row on a page
+
+    Returns None when created_at is NULL: such a row has no keyset position, so the
+    caller omits the next-cursor header and clients fall back to skip.
+    """
+    if created_at is None:
+        return None
+    return f"{created_at.isoformat()}_{row_id}"
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Decode a cursor produced by encode_cursor, raising 400 if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        created_at, _, row_id = cursor.rpartition("_")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor '{cursor}'")
@@ -18,6 +18,7 @@ from app.services.session_manager import SessionManager
 from app.services.mq_bridge import MQBridge
 from app.models.database import init_db
 from app.core.config import settings, create_ssl_context, get_uvicorn_ssl_kwargs
+from app.core.pagination import NEXT_CURSOR_HEADER
 from app.core.security import verify_token
 
 logging.basicConfig(
@@ -44,6 +45,7 @@ async def lifespan(app: FastAPI):
     mq_bridge = MQBridge()
     ocpp_handler = OCPPHandler(session_manager, mq_bridge)
     app.state.ocpp_handler = ocpp_handler
+    app.state.mq_bridge = mq_bridge
     asyncio.create_task(mq_bridge.start())
     asyncio.create_task(ocpp_handler.start_websocket_server())
     asyncio.create_task(session_manager.start())  # Added to start SessionManager
@@ -71,6 +73,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset pagination hands the next cursor back in a header, which browsers hide unless exposed
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 security = HTTPBearer()
@@ -154,5 +158,6 @@ if __name__ == "__main__":
         port=port,
         reload=reload,
         log_level="info",
+        loop="auto",  # uvloop when installed, asyncio otherwise
         **ssl_kwargs
     )
\ No newline at end of file
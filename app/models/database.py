@@ -2,7 +2,7 @@
 Database models and initialization
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, JSON, Index
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -11,7 +11,21 @@ import json
 from app.core.config import settings
 
 # Create database engine
-engine = create_engine(settings.DATABASE_URL, echo=settings.DEBUG)
+if settings.DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(settings.DATABASE_URL, echo=settings.DEBUG)
+else:
+    # Size the pool for burst traffic so requests don't queue on the 5-connection default.
+    # LIFO checkout keeps reusing the most recently returned (warm) connections and lets
+    # the rest sit idle long enough to be recycled.
+    engine = create_engine(
+        settings.DATABASE_URL,
+        echo=settings.DEBUG,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -56,6 +70,11 @@ class Charger(Base):
     connectors = relationship("Connector", back_populates="charger")
     messages = relationship("MessageLog", back_populates="charger")
     connection_events = relationship("ConnectionEvent", back_populates="charger")
+    
+    # heartbeat_monitor looks up connected chargers whose last_heartbeat is past a threshold
+    __table_args__ = (
+        Index("ix_charger_connected_heartbeat", "is_connected", "last_heartbeat"),
+    )
 
 class Connector(Base):
     """Connector model"""
@@ -80,6 +99,11 @@ class Connector(Base):
     # Relationships
     charger = relationship("Charger", back_populates="connectors")
     sessions = relationship("Session", back_populates="connector")
+    
+    # OCPP messages address connectors by (charger_id, connector_id)
+    __table_args__ = (
+        Index("ix_connector_charger_connector", "charger_id", "connector_id"),
+    )
 
 class Session(Base):
     """Charging session model"""
@@ -188,6 +212,12 @@ class ConnectionEvent(Base):
     
     # Relationships
     charger = relationship("Charger", back_populates="connection_events")
+    
+    # Latest events overall and per charger (ORDER BY timestamp DESC LIMIT n)
+    __table_args__ = (
+        Index("ix_ce_ts", "timestamp"),
+        Index("ix_ce_charger_ts", "charger_id", "timestamp"),
+    )
 
 class RFIDCard(Base):
     """RFID Card model for authorization"""
@@ -229,6 +259,14 @@ class RFIDCard(Base):
     
     # Relationships
     user = relationship("User", backref="rfid_cards")
+    
+    # Indexes matching the list_rfid_cards filters (filter + ORDER BY created_at DESC)
+    __table_args__ = (
+        Index("ix_rfid_created", "created_at"),
+        Index("ix_rfid_org_created", "organization_id", "created_at"),
+        Index("ix_rfid_site_created", "site_id", "created_at"),
+        Index("ix_rfid_user_active", "user_id", "is_active"),
+    )
 
 class User(Base):
     """User model for authentication"""
@@ -254,6 +292,13 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = Column(DateTime, nullable=True)
+    
+    # Indexes matching the list_users filters (filter + ORDER BY created_at DESC)
+    __table_args__ = (
+        Index("ix_user_created", "created_at"),
+        Index("ix_user_org_created", "organization_id", "created_at"),
+        Index("ix_user_active_verified", "is_active", "is_verified"),
+    )
 
 # Database dependency
 def get_db():
@@ -4,7 +4,7 @@ Connector management endpoints
 
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_
 from pydantic import BaseModel, Field
@@ -13,6 +13,12 @@ from app.models.database import get_db, Connector, Charger
 
 router = APIRouter()
 
+def forget_connector_states(request: Request, charger_id: str):
+    """Make the running OCPP handler write the charger's next StatusNotification even if unchanged"""
+    ocpp_handler = getattr(request.app.state, "ocpp_handler", None)
+    if ocpp_handler:
+        ocpp_handler.forget_connector_states(charger_id)
+
 # Pydantic models for request/response
 class ConnectorResponse(BaseModel):
     id: int
@@ -199,6 +205,7 @@ async def get_charger_connectors(
 
 @router.put("/connectors/{connector_id}", response_model=ConnectorResponse)
 async def update_connector(
+    request: Request,
     connector_id: int = Path(..., description="Database ID of the connector"),
     update_data: ConnectorUpdateRequest = ...,
     db: Session = Depends(get_db)
@@ -231,11 +238,13 @@ async def update_connector(
     
     db.commit()
     db.refresh(connector)
+    forget_connector_states(request, connector.charger_id)
     
     return connector
 
 @router.delete("/connectors/{connector_id}", status_code=204)
 async def delete_connector(
+    request: Request,
     connector_id: int = Path(..., description="Database ID of the connector"),
     db: Session = Depends(get_db)
 ):
@@ -268,6 +277,7 @@ async def delete_connector(
     
     db.delete(connector)
     db.commit()
+    forget_connector_states(request, connector.charger_id)
     
     return None
 
@@ -549,8 +549,7 @@ async def unlock_connector(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during unlock command")
         raise HTTPException(
@@ -644,8 +643,7 @@ async def get_configuration(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during command")
         raise HTTPException(
@@ -787,8 +785,7 @@ async def change_availability(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during availability change")
         raise HTTPException(
@@ -851,8 +848,7 @@ async def reset_charger(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during reset command")
         raise HTTPException(
@@ -976,8 +972,7 @@ async def charging_remote_start(request: Request, body: RemoteStartBody, db: Ses
         )
     
     # Double-check that charger is still in active connections
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if body.charger_id not in connected_ids:
+    if body.charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {body.charger_id} not found in active connections during remote start")
         raise HTTPException(
@@ -1091,16 +1086,15 @@ async def charging_remote_stop(request: Request, body: RemoteStopBody, db: Sessi
     ocpp_handler = getattr(request.app.state, "ocpp_handler", None)
     if not ocpp_handler or not hasattr(ocpp_handler, "charger_connections"):
         raise HTTPException(status_code=500, detail="OCPP handler not available")
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if not connected_ids:
+    if not ocpp_handler.charger_connections:
         raise HTTPException(
             status_code=404,
             detail="No chargers are currently connected via WebSocket. Please ensure your OCPP client is connected to wss://localhost:9001/ocpp/{charger_id} before sending remote commands."
         )
-    if body.charger_id not in connected_ids:
+    if body.charger_id not in ocpp_handler.charger_connections:
         raise HTTPException(
             status_code=404,
-            detail=f"Charger '{body.charger_id}' not connected. Connected charger_ids: {connected_ids}. Please connect your OCPP client to wss://localhost:9001/ocpp/{body.charger_id}"
+            detail=f"Charger '{body.charger_id}' not connected. Connected charger_ids: {list(ocpp_handler.charger_connections)}. Please connect your OCPP client to wss://localhost:9001/ocpp/{body.charger_id}"
         )
 
     # Get active session from database to retrieve transaction_id
@@ -1173,8 +1167,7 @@ async def send_local_list(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during command")
         raise HTTPException(
@@ -1291,8 +1284,7 @@ async def clear_cache(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during command")
         raise HTTPException(
@@ -1493,8 +1485,7 @@ async def get_local_list_version(
             detail=f"Charger '{charger_id}' is not currently connected. Last event: '{latest_connection_event.event_type}'"
         )
 
-    connected_ids = list(ocpp_handler.charger_connections.keys())
-    if charger_id not in connected_ids:
+    if charger_id not in ocpp_handler.charger_connections:
         # Don't create disconnect event - let OCPP handler manage connection state
         logger.warning(f"Charger {charger_id} not found in active connections during command")
         raise HTTPException(
@@ -1804,10 +1795,17 @@ class SystemRetryConfigResponse(BaseModel):
     message: str
 
 # Retry Configuration Endpoints
+def invalidate_retry_config(request: Request, charger_id: Optional[str] = None):
+    """Make the running OCPP handler pick up changed retry settings right away"""
+    ocpp_handler = getattr(request.app.state, "ocpp_handler", None)
+    if ocpp_handler:
+        ocpp_handler.invalidate_retry_config(charger_id)
+
 @router.post("/retry-config/{charger_id}", response_model=RetryConfigResponse)
 async def set_charger_retry_config(
     charger_id: str,
     config: RetryConfigRequest,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Set retry configuration for a specific charger"""
@@ -1822,6 +1820,7 @@ async def set_charger_retry_config(
         charger.updated_at = get_egypt_now()
         
         db.commit()
+        invalidate_retry_config(request, charger_id)
         
         logger.info(f"Updated retry config for charger {charger_id}: max_retries={config.max_retries}, retry_interval={config.retry_interval}s, retry_enabled={config.retry_enabled}")
         
@@ -1864,6 +1863,7 @@ async def get_charger_retry_config(
 @router.post("/retry-config/system", response_model=SystemRetryConfigResponse)
 async def set_system_retry_config(
     config: SystemRetryConfigRequest,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Set default retry configuration for all chargers"""
@@ -1895,6 +1895,7 @@ async def set_system_retry_config(
             db.add(retry_interval_config)
         
         db.commit()
+        invalidate_retry_config(request)
         
         logger.info(f"Updated system retry config: max_retries={config.max_retries}, retry_interval={config.retry_interval}s")
         
@@ -1932,6 +1933,7 @@ async def get_system_retry_config(
 @router.post("/retry-config/{charger_id}/enable")
 async def enable_charger_retry(
     charger_id: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Enable retry functionality for a specific charger"""
@@ -1943,6 +1945,7 @@ async def enable_charger_retry(
         charger.retry_enabled = True
         charger.updated_at = get_egypt_now()
         db.commit()
+        invalidate_retry_config(request, charger_id)
         
         logger.info(f"Enabled retry for charger {charger_id}")
         
@@ -1956,6 +1959,7 @@ async def enable_charger_retry(
 @router.post("/retry-config/{charger_id}/disable")
 async def disable_charger_retry(
     charger_id: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Disable retry functionality for a specific charger"""
@@ -1967,6 +1971,7 @@ async def disable_charger_retry(
         charger.retry_enabled = False
         charger.updated_at = get_egypt_now()
         db.commit()
+        invalidate_retry_config(request, charger_id)
         
         logger.info(f"Disabled retry for charger {charger_id}")
         
@@ -1,16 +1,24 @@
 """
 RFID Card management endpoints
 """
+import logging
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, lambda_stmt, or_, and_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
-from app.models.database import get_db, RFIDCard, User
-from app.core.config import get_egypt_now
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from app.models.database import get_db, SessionLocal, RFIDCard, User
+from app.core.config import settings, get_egypt_now
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+RFID_STATUS_CACHE_PREFIX = "rfidstat:"
+
 # Request/Response models
 class RFIDCardCreate(BaseModel):
     id_tag: str = Field(..., description="RFID tag ID (unique)")
@@ -40,6 +48,8 @@ class RFIDCardUpdate(BaseModel):
     wattage_limit: Optional[float] = Field(None, ge=0, description="Total wattage limit assigned to this RFID card (in Wh). If updated, remaining_wattage will be reset to this value if not already set.")
 
 class RFIDCardResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     id_tag: str
     card_number: Optional[str]
@@ -58,8 +68,8 @@ class RFIDCardResponse(BaseModel):
     updated_at: datetime
     last_used_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+# Built once at import; list pages are serialized straight to JSON bytes by pydantic-core
+CARD_LIST_ADAPTER = TypeAdapter(List[RFIDCardResponse])
 
 class RFIDCardStatusResponse(BaseModel):
     id_tag: str
@@ -88,17 +98,40 @@ def get_authorization_status(card: Optional[RFIDCard]) -> str:
     
     return "Accepted"
 
+def get_write_db():
+    """Session for card writes that keeps committed cards loaded, so they are returned without a refresh SELECT"""
+    # Every RFIDCard column default is Python-side and is populated on the instance at flush time
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_status_cache(request: Request):
+    """Redis client shared with the MQ bridge, or None when Redis is unavailable"""
+    mq_bridge = getattr(request.app.state, "mq_bridge", None)
+    return getattr(mq_bridge, "redis_client", None)
+
+async def invalidate_rfid_status(request: Request, *id_tags: str):
+    """Drop cached authorization status for the given id_tags"""
+    ocpp_handler = getattr(request.app.state, "ocpp_handler", None)
+    if ocpp_handler:
+        ocpp_handler.invalidate_authorize_cache(*id_tags)
+    cache = get_status_cache(request)
+    if not cache or not id_tags:
+        return
+    try:
+        await cache.delete(*[f"{RFID_STATUS_CACHE_PREFIX}{id_tag}" for id_tag in id_tags])
+    except Exception as e:
+        logger.warning(f"Failed to invalidate RFID status cache: {e}")
+
 @router.post("/rfid-cards", response_model=RFIDCardResponse, tags=["RFID Cards"])
 async def create_rfid_card(
     card: RFIDCardCreate,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_write_db)
 ):
     """Create a new RFID card"""
-    # Check if id_tag already exists
-    existing = db.query(RFIDCard).filter(RFIDCard.id_tag == card.id_tag).first()
-    if existing:
-        raise HTTPException(status_code=409, detail=f"RFID card with id_tag '{card.id_tag}' already exists")
-    
     # Check if user_id exists (if provided)
     if card.user_id:
         user = db.query(User).filter(User.id == card.user_id).first()
@@ -122,9 +155,16 @@ async def create_rfid_card(
         remaining_wattage=card.wattage_limit if card.wattage_limit is not None else None
     )
     
+    # Rely on the id_tag unique constraint instead of a pre-SELECT for duplicates
     db.add(db_card)
-    db.commit()
-    db.refresh(db_card)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        if db.query(RFIDCard.id).filter(RFIDCard.id_tag == card.id_tag).first():
+            raise HTTPException(status_code=409, detail=f"RFID card with id_tag '{card.id_tag}' already exists")
+        raise
+    await invalidate_rfid_status(request, db_card.id_tag)
     
     return db_card
 
@@ -132,6 +172,7 @@ async def create_rfid_card(
 async def list_rfid_cards(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description=f"Keyset cursor from the {NEXT_CURSOR_HEADER} header of the previous page (replaces skip)"),
     is_active: Optional[bool] = None,
     is_blocked: Optional[bool] = None,
     organization_id: Optional[str] = None,
@@ -140,26 +181,46 @@ async def list_rfid_cards(
     db: Session = Depends(get_db)
 ):
     """List RFID cards with optional filters"""
-    query = db.query(RFIDCard)
+    # lambda_stmt caches the compiled SQL per filter combination across requests;
+    # the closure values become bound parameters. Selecting the table (not the
+    # entity) returns column rows matching RFIDCardResponse.
+    stmt = lambda_stmt(lambda: select(RFIDCard.__table__))
     
     if is_active is not None:
-        query = query.filter(RFIDCard.is_active == is_active)
+        stmt += lambda s: s.where(RFIDCard.is_active == is_active)
     
     if is_blocked is not None:
-        query = query.filter(RFIDCard.is_blocked == is_blocked)
+        stmt += lambda s: s.where(RFIDCard.is_blocked == is_blocked)
     
     if organization_id:
-        query = query.filter(RFIDCard.organization_id == organization_id)
+        stmt += lambda s: s.where(RFIDCard.organization_id == organization_id)
     
     if site_id:
-        query = query.filter(RFIDCard.site_id == site_id)
+        stmt += lambda s: s.where(RFIDCard.site_id == site_id)
     
     if user_id:
-        query = query.filter(RFIDCard.user_id == user_id)
-    
-    cards = query.order_by(RFIDCard.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return cards
+        stmt += lambda s: s.where(RFIDCard.user_id == user_id)
+    
+    position = decode_cursor(cursor)
+    if position:
+        # Keyset pagination: seek past the last row of the previous page via the created_at index
+        cursor_created_at, cursor_id = position
+        stmt += lambda s: s.where(or_(
+            RFIDCard.created_at < cursor_created_at,
+            and_(RFIDCard.created_at == cursor_created_at, RFIDCard.id < cursor_id)
+        ))
+        stmt += lambda s: s.order_by(RFIDCard.created_at.desc(), RFIDCard.id.desc()).limit(limit)
+    else:
+        stmt += lambda s: s.order_by(RFIDCard.created_at.desc(), RFIDCard.id.desc()).offset(skip).limit(limit)
+    
+    # Plain column rows skip ORM identity-map hydration for list pages
+    cards = [RFIDCardResponse.model_construct(**row._mapping) for row in db.execute(stmt)]
+    headers = {}
+    next_cursor = encode_cursor(cards[-1].created_at, cards[-1].id) if len(cards) == limit else None
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return Response(CARD_LIST_ADAPTER.dump_json(cards), media_type="application/json", headers=headers)
 
 @router.get("/rfid-cards/{id_tag}", response_model=RFIDCardResponse, tags=["RFID Cards"])
 async def get_rfid_card(
@@ -177,54 +238,57 @@ async def get_rfid_card(
 async def update_rfid_card(
     id_tag: str,
     card_update: RFIDCardUpdate,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Update RFID card"""
-    card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
-    if not card:
-        raise HTTPException(status_code=404, detail=f"RFID card with id_tag '{id_tag}' not found")
-    
     # Check if user_id exists (if being updated)
-    if card_update.user_id is not None and card_update.user_id != card.user_id:
+    if card_update.user_id is not None:
         user = db.query(User).filter(User.id == card_update.user_id).first()
         if not user:
             raise HTTPException(status_code=404, detail=f"User with ID {card_update.user_id} not found")
     
     # Update fields
-    update_data = card_update.dict(exclude_unset=True)
+    update_data = card_update.model_dump(exclude_unset=True)
     
     # If wattage_limit is being updated, always reset remaining_wattage to the new limit
     if "wattage_limit" in update_data and update_data["wattage_limit"] is not None:
         update_data["remaining_wattage"] = update_data["wattage_limit"]
     
-    for field, value in update_data.items():
-        setattr(card, field, value)
+    update_data["updated_at"] = get_egypt_now()
     
-    card.updated_at = get_egypt_now()
+    # Single UPDATE ... WHERE instead of SELECT + per-field setattr + flush
+    rows = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).update(update_data, synchronize_session=False)
+    if rows == 0:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=f"RFID card with id_tag '{id_tag}' not found")
     db.commit()
-    db.refresh(card)
+    await invalidate_rfid_status(request, id_tag)
     
-    return card
+    return db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
 
 @router.delete("/rfid-cards/{id_tag}", tags=["RFID Cards"])
 async def delete_rfid_card(
     id_tag: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Delete RFID card"""
-    card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
-    if not card:
+    rows = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).delete(synchronize_session=False)
+    if rows == 0:
+        db.rollback()
         raise HTTPException(status_code=404, detail=f"RFID card with id_tag '{id_tag}' not found")
     
-    db.delete(card)
     db.commit()
+    await invalidate_rfid_status(request, id_tag)
     
     return {"message": f"RFID card with id_tag '{id_tag}' deleted successfully"}
 
 @router.post("/rfid-cards/{id_tag}/block", response_model=RFIDCardResponse, tags=["RFID Cards"])
 async def block_rfid_card(
     id_tag: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_write_db)
 ):
     """Block an RFID card"""
     card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
@@ -234,14 +298,15 @@ async def block_rfid_card(
     card.is_blocked = True
     card.updated_at = get_egypt_now()
     db.commit()
-    db.refresh(card)
+    await invalidate_rfid_status(request, id_tag)
     
     return card
 
 @router.post("/rfid-cards/{id_tag}/unblock", response_model=RFIDCardResponse, tags=["RFID Cards"])
 async def unblock_rfid_card(
     id_tag: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_write_db)
 ):
     """Unblock an RFID card"""
     card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
@@ -251,14 +316,15 @@ async def unblock_rfid_card(
     card.is_blocked = False
     card.updated_at = get_egypt_now()
     db.commit()
-    db.refresh(card)
+    await invalidate_rfid_status(request, id_tag)
     
     return card
 
 @router.post("/rfid-cards/{id_tag}/activate", response_model=RFIDCardResponse, tags=["RFID Cards"])
 async def activate_rfid_card(
     id_tag: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_write_db)
 ):
     """Activate an RFID card"""
     card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
@@ -268,14 +334,15 @@ async def activate_rfid_card(
     card.is_active = True
     card.updated_at = get_egypt_now()
     db.commit()
-    db.refresh(card)
+    await invalidate_rfid_status(request, id_tag)
     
     return card
 
 @router.post("/rfid-cards/{id_tag}/deactivate", response_model=RFIDCardResponse, tags=["RFID Cards"])
 async def deactivate_rfid_card(
     id_tag: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_write_db)
 ):
     """Deactivate an RFID card"""
     card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
@@ -285,20 +352,31 @@ async def deactivate_rfid_card(
     card.is_active = False
     card.updated_at = get_egypt_now()
     db.commit()
-    db.refresh(card)
+    await invalidate_rfid_status(request, id_tag)
     
     return card
 
 @router.get("/rfid-cards/{id_tag}/status", response_model=RFIDCardStatusResponse, tags=["RFID Cards"])
 async def get_rfid_card_status(
     id_tag: str,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """Check RFID card authorization status"""
+    cache = get_status_cache(request)
+    cache_key = f"{RFID_STATUS_CACHE_PREFIX}{id_tag}"
+    if cache:
+        try:
+            cached = await cache.get(cache_key)
+            if cached:
+                return Response(content=cached, media_type="application/json")
+        except Exception as e:
+            logger.warning(f"RFID status cache read failed: {e}")
+    
     card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
     
     if not card:
-        return RFIDCardStatusResponse(
+        status_response = RFIDCardStatusResponse(
             id_tag=id_tag,
             exists=False,
             status="Invalid",
@@ -307,41 +385,62 @@ async def get_rfid_card_status(
             expires_at=None,
             last_used_at=None
         )
+    else:
+        status_response = RFIDCardStatusResponse(
+            id_tag=card.id_tag,
+            exists=True,
+            status=get_authorization_status(card),
+            is_active=card.is_active,
+            is_blocked=card.is_blocked,
+            expires_at=card.expires_at,
+            last_used_at=card.last_used_at
+        )
     
-    status = get_authorization_status(card)
+    if cache:
+        try:
+            await cache.set(cache_key, status_response.model_dump_json(), ex=settings.RFID_STATUS_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"RFID status cache write failed: {e}")
     
-    return RFIDCardStatusResponse(
-        id_tag=card.id_tag,
-        exists=True,
-        status=status,
-        is_active=card.is_active,
-        is_blocked=card.is_blocked,
-        expires_at=card.expires_at,
-        last_used_at=card.last_used_at
-    )
+    return status_response
 
 @router.post("/rfid-cards/bulk", response_model=List[RFIDCardResponse], tags=["RFID Cards"])
 async def bulk_create_rfid_cards(
     cards: List[RFIDCardCreate],
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_write_db)
 ):
     """Bulk create RFID cards"""
     created_cards = []
     errors = []
     
+    # Fetch all conflicting id_tags and referenced users in two set-based queries
+    id_tags = [card_data.id_tag for card_data in cards]
+    existing_tags = set()
+    if id_tags:
+        existing_tags = {
+            row[0] for row in db.query(RFIDCard.id_tag).filter(RFIDCard.id_tag.in_(id_tags)).all()
+        }
+    
+    user_ids = {card_data.user_id for card_data in cards if card_data.user_id}
+    valid_user_ids = set()
+    if user_ids:
+        valid_user_ids = {
+            row[0] for row in db.query(User.id).filter(User.id.in_(user_ids)).all()
+        }
+    
     for card_data in cards:
-        # Check if id_tag already exists
-        existing = db.query(RFIDCard).filter(RFIDCard.id_tag == card_data.id_tag).first()
-        if existing:
+        # Check if id_tag already exists (in the database or earlier in this batch)
+        if card_data.id_tag in existing_tags:
             errors.append(f"RFID card with id_tag '{card_data.id_tag}' already exists")
             continue
         
         # Check if user_id exists (if provided)
-        if card_data.user_id:
-            user = db.query(User).filter(User.id == card_data.user_id).first()
-            if not user:
-                errors.append(f"User with ID {card_data.user_id} not found for card '{card_data.id_tag}'")
-                continue
+        if card_data.user_id and card_data.user_id not in valid_user_ids:
+            errors.append(f"User with ID {card_data.user_id} not found for card '{card_data.id_tag}'")
+            continue
+        
+        existing_tags.add(card_data.id_tag)
         
         # Create new RFID card
         db_card = RFIDCard(
@@ -360,7 +459,6 @@ async def bulk_create_rfid_cards(
             remaining_wattage=card_data.wattage_limit if card_data.wattage_limit is not None else None
         )
         
-        db.add(db_card)
         created_cards.append(db_card)
     
     if errors:
@@ -371,11 +469,9 @@ async def bulk_create_rfid_cards(
             "created_count": 0
         })
     
+    db.add_all(created_cards)
     db.commit()
-    
-    # Refresh all created cards
-    for card in created_cards:
-        db.refresh(card)
+    await invalidate_rfid_status(request, *[card.id_tag for card in created_cards])
     
     return created_cards
 
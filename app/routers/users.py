@@ -1,17 +1,34 @@
 """
 User management endpoints
 """
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field, EmailStr, validator
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import Session, selectinload, raiseload
+from sqlalchemy import func, case, and_, or_
+from sqlalchemy.exc import IntegrityError
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, TypeAdapter, field_validator
 import bcrypt
 from app.models.database import get_db, User, RFIDCard
-from app.core.config import get_egypt_now
+from app.core.config import settings, get_egypt_now
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
 
 router = APIRouter()
 
+# Dedicated pool for bcrypt so password hashing doesn't queue behind (or starve)
+# the shared Starlette threadpool. bcrypt releases the GIL, so these threads
+# hash on separate cores without the pickling cost of a process pool.
+password_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="bcrypt")
+
+async def run_password_task(func, *args):
+    """Run a bcrypt hash/verify call on the dedicated password executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, func, *args)
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
     # Bcrypt has a 72-byte limit, so truncate if necessary
@@ -20,7 +37,7 @@ def hash_password(password: str) -> str:
         password_bytes = password_bytes[:72]
     
     # Generate salt and hash
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -48,7 +65,8 @@ class UserCreate(BaseModel):
     is_active: bool = Field(True, description="Whether user is active")
     is_verified: bool = Field(False, description="Whether user email is verified")
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def validate_password_length(cls, v):
         """Validate password doesn't exceed 72 bytes (bcrypt limit)"""
         if len(v.encode('utf-8')) > 72:
@@ -66,6 +84,8 @@ class UserUpdate(BaseModel):
     is_verified: Optional[bool] = None
 
 class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     username: str
     email: str
@@ -78,14 +98,18 @@ class UserResponse(BaseModel):
     updated_at: datetime
     last_login: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+# Only the columns UserResponse exposes (skips hashed_password)
+USER_RESPONSE_COLUMNS = tuple(getattr(User, name) for name in UserResponse.model_fields)
+
+# Built once at import; list pages are serialized straight to JSON bytes by pydantic-core
+USER_LIST_ADAPTER = TypeAdapter(List[UserResponse])
 
 class UserChangePassword(BaseModel):
     current_password: str = Field(..., description="Current password")
     new_password: str = Field(..., min_length=6, max_length=72, description="New password (min 6 characters, max 72 bytes)")
     
-    @validator('new_password')
+    @field_validator('new_password')
+    @classmethod
     def validate_password_length(cls, v):
         """Validate password doesn't exceed 72 bytes (bcrypt limit)"""
         if len(v.encode('utf-8')) > 72:
@@ -95,7 +119,8 @@ class UserChangePassword(BaseModel):
 class UserResetPassword(BaseModel):
     new_password: str = Field(..., min_length=6, max_length=72, description="New password (min 6 characters, max 72 bytes)")
     
-    @validator('new_password')
+    @field_validator('new_password')
+    @classmethod
     def validate_password_length(cls, v):
         """Validate password doesn't exceed 72 bytes (bcrypt limit)"""
         if len(v.encode('utf-8')) > 72:
@@ -108,18 +133,8 @@ async def create_user(
     db: Session = Depends(get_db)
 ):
     """Create a new user"""
-    # Check if username already exists
-    existing_username = db.query(User).filter(User.username == user.username).first()
-    if existing_username:
-        raise HTTPException(status_code=409, detail=f"Username '{user.username}' already exists")
-    
-    # Check if email already exists
-    existing_email = db.query(User).filter(User.email == user.email).first()
-    if existing_email:
-        raise HTTPException(status_code=409, detail=f"Email '{user.email}' already exists")
-    
-    # Hash password
-    hashed_password = hash_password(user.password)
+    # Hash password (off the event loop - bcrypt is CPU-bound)
+    hashed_password = await run_password_task(hash_password, user.password)
     
     # Create new user
     db_user = User(
@@ -133,8 +148,18 @@ async def create_user(
         is_verified=user.is_verified
     )
     
+    # Rely on the unique constraints instead of pre-SELECTs for duplicates
     db.add(db_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # Work out which unique column conflicted (error path only)
+        if db.query(User.id).filter(User.username == user.username).first():
+            raise HTTPException(status_code=409, detail=f"Username '{user.username}' already exists")
+        if db.query(User.id).filter(User.email == user.email).first():
+            raise HTTPException(status_code=409, detail=f"Email '{user.email}' already exists")
+        raise
     db.refresh(db_user)
     
     # Return user without password
@@ -144,6 +169,7 @@ async def create_user(
 async def list_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description=f"Keyset cursor from the {NEXT_CURSOR_HEADER} header of the previous page (replaces skip)"),
     is_active: Optional[bool] = None,
     is_verified: Optional[bool] = None,
     organization_id: Optional[str] = None,
@@ -152,7 +178,7 @@ async def list_users(
     db: Session = Depends(get_db)
 ):
     """List users with optional filters"""
-    query = db.query(User)
+    query = db.query(*USER_RESPONSE_COLUMNS)
     
     if is_active is not None:
         query = query.filter(User.is_active == is_active)
@@ -168,14 +194,34 @@ async def list_users(
     
     if search:
         search_pattern = f"%{search}%"
+        # ILIKE is backed by the pg_trgm GIN indexes on PostgreSQL (see migrate_add_list_indexes.py)
         query = query.filter(
-            (User.username.like(search_pattern)) |
-            (User.email.like(search_pattern))
+            (User.username.ilike(search_pattern)) |
+            (User.email.ilike(search_pattern))
         )
     
-    users = query.order_by(User.created_at.desc()).offset(skip).limit(limit).all()
+    position = decode_cursor(cursor)
+    if position:
+        # Keyset pagination: seek past the last row of the previous page via the created_at index
+        cursor_created_at, cursor_id = position
+        query = query.filter(or_(
+            User.created_at < cursor_created_at,
+            and_(User.created_at == cursor_created_at, User.id < cursor_id)
+        ))
+    
+    query = query.order_by(User.created_at.desc(), User.id.desc())
+    if not position:
+        query = query.offset(skip)
+    
+    rows = query.limit(limit).all()
+    
+    users = [UserResponse.model_construct(**row._mapping) for row in rows]
+    headers = {}
+    next_cursor = encode_cursor(users[-1].created_at, users[-1].id) if len(users) == limit else None
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
     
-    return users
+    return Response(USER_LIST_ADAPTER.dump_json(users), media_type="application/json", headers=headers)
 
 @router.get("/users/{user_id}", response_model=UserResponse, tags=["Users"])
 async def get_user(
@@ -183,7 +229,7 @@ async def get_user(
     db: Session = Depends(get_db)
 ):
     """Get user by ID"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id, options=[raiseload('*')])
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
@@ -195,7 +241,7 @@ async def get_user_by_username(
     db: Session = Depends(get_db)
 ):
     """Get user by username"""
-    user = db.query(User).filter(User.username == username).first()
+    user = db.query(User).options(raiseload('*')).filter(User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail=f"User with username '{username}' not found")
     
@@ -207,7 +253,7 @@ async def get_user_by_email(
     db: Session = Depends(get_db)
 ):
     """Get user by email"""
-    user = db.query(User).filter(User.email == email).first()
+    user = db.query(User).options(raiseload('*')).filter(User.email == email).first()
     if not user:
         raise HTTPException(status_code=404, detail=f"User with email '{email}' not found")
     
@@ -220,37 +266,36 @@ async def update_user(
     db: Session = Depends(get_db)
 ):
     """Update user"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-    
-    # Check if username is being changed and already exists
-    if user_update.username and user_update.username != user.username:
-        existing = db.query(User).filter(User.username == user_update.username).first()
+    # Check if username is being changed and already taken by another user
+    if user_update.username:
+        existing = db.query(User).filter(User.username == user_update.username, User.id != user_id).first()
         if existing:
             raise HTTPException(status_code=409, detail=f"Username '{user_update.username}' already exists")
     
-    # Check if email is being changed and already exists
-    if user_update.email and user_update.email != user.email:
-        existing = db.query(User).filter(User.email == user_update.email).first()
+    # Check if email is being changed and already taken by another user
+    if user_update.email:
+        existing = db.query(User).filter(User.email == user_update.email, User.id != user_id).first()
         if existing:
             raise HTTPException(status_code=409, detail=f"Email '{user_update.email}' already exists")
     
     # Update fields
-    update_data = user_update.dict(exclude_unset=True)
+    update_data = user_update.model_dump(exclude_unset=True)
     
     # Hash password if provided
     if 'password' in update_data:
-        update_data['hashed_password'] = hash_password(update_data.pop('password'))
+        update_data['hashed_password'] = await run_password_task(hash_password, update_data.pop('password'))
     
-    for field, value in update_data.items():
-        setattr(user, field, value)
+    update_data['updated_at'] = get_egypt_now()
     
-    user.updated_at = get_egypt_now()
+    # Single UPDATE ... WHERE instead of SELECT + per-field setattr + flush
+    rows = db.query(User).filter(User.id == user_id).update(update_data, synchronize_session=False)
+    if rows == 0:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     db.commit()
-    db.refresh(user)
     
-    return user
+    # populate_existing: the bulk UPDATE above bypassed the identity map
+    return db.get(User, user_id, populate_existing=True)
 
 @router.delete("/users/{user_id}", tags=["Users"])
 async def delete_user(
@@ -258,19 +303,21 @@ async def delete_user(
     db: Session = Depends(get_db)
 ):
     """Delete user"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-    
-    # Check if user has associated RFID cards
-    rfid_cards = db.query(RFIDCard).filter(RFIDCard.user_id == user_id).count()
-    if rfid_cards > 0:
+    # Single DELETE guarded by NOT EXISTS on associated RFID cards
+    has_rfid_cards = db.query(RFIDCard).filter(RFIDCard.user_id == user_id).exists()
+    rows = db.query(User).filter(User.id == user_id, ~has_rfid_cards).delete(synchronize_session=False)
+    
+    if rows == 0:
+        db.rollback()
+        # Nothing deleted: either the user doesn't exist or it still has cards
+        if not db.get(User, user_id):
+            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+        rfid_cards = db.query(RFIDCard).filter(RFIDCard.user_id == user_id).count()
         raise HTTPException(
             status_code=400,
             detail=f"Cannot delete user: {rfid_cards} RFID card(s) are associated with this user. Please remove or reassign RFID cards first."
         )
     
-    db.delete(user)
     db.commit()
     
     return {"message": f"User with ID {user_id} deleted successfully"}
@@ -281,7 +328,7 @@ async def activate_user(
     db: Session = Depends(get_db)
 ):
     """Activate a user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
@@ -298,7 +345,7 @@ async def deactivate_user(
     db: Session = Depends(get_db)
 ):
     """Deactivate a user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
@@ -315,7 +362,7 @@ async def verify_user(
     db: Session = Depends(get_db)
 ):
     """Mark user as verified"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
@@ -333,16 +380,16 @@ async def change_password(
     db: Session = Depends(get_db)
 ):
     """Change user password (requires current password)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
     # Verify current password
-    if not verify_password(password_data.current_password, user.hashed_password):
+    if not await run_password_task(verify_password, password_data.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     # Update password
-    user.hashed_password = hash_password(password_data.new_password)
+    user.hashed_password = await run_password_task(hash_password, password_data.new_password)
     user.updated_at = get_egypt_now()
     db.commit()
     
@@ -355,12 +402,12 @@ async def reset_password(
     db: Session = Depends(get_db)
 ):
     """Reset user password (admin function - no current password required)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
     # Update password
-    user.hashed_password = hash_password(password_data.new_password)
+    user.hashed_password = await run_password_task(hash_password, password_data.new_password)
     user.updated_at = get_egypt_now()
     db.commit()
     
@@ -372,13 +419,14 @@ async def get_user_rfid_cards(
     db: Session = Depends(get_db)
 ):
     """Get all RFID cards associated with a user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id, options=[selectinload(User.rfid_cards)])
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
-    rfid_cards = db.query(RFIDCard).filter(RFIDCard.user_id == user_id).all()
+    rfid_cards = user.rfid_cards
     
-    return {
+    # orjson serializes datetime (and None) natively
+    return ORJSONResponse({
         "user_id": user_id,
         "username": user.username,
         "rfid_cards": [
@@ -389,13 +437,13 @@ async def get_user_rfid_cards(
                 "holder_name": card.holder_name,
                 "is_active": card.is_active,
                 "is_blocked": card.is_blocked,
-                "created_at": card.created_at.isoformat(),
-                "last_used_at": card.last_used_at.isoformat() if card.last_used_at else None
+                "created_at": card.created_at,
+                "last_used_at": card.last_used_at
             }
             for card in rfid_cards
         ],
         "total": len(rfid_cards)
-    }
+    })
 
 @router.get("/users/{user_id}/stats", tags=["Users"])
 async def get_user_stats(
@@ -403,18 +451,17 @@ async def get_user_stats(
     db: Session = Depends(get_db)
 ):
     """Get user statistics"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
-    rfid_cards_count = db.query(RFIDCard).filter(RFIDCard.user_id == user_id).count()
-    active_rfid_cards = db.query(RFIDCard).filter(
-        RFIDCard.user_id == user_id,
-        RFIDCard.is_active == True,
-        RFIDCard.is_blocked == False
-    ).count()
+    # Total and active card counts in a single aggregate query
+    rfid_cards_count, active_rfid_cards = db.query(
+        func.count(RFIDCard.id),
+        func.count(case((and_(RFIDCard.is_active == True, RFIDCard.is_blocked == False), 1)))
+    ).filter(RFIDCard.user_id == user_id).one()
     
-    return {
+    return ORJSONResponse({
         "user_id": user_id,
         "username": user.username,
         "email": user.email,
@@ -423,7 +470,7 @@ async def get_user_stats(
         "roles": user.roles,
         "rfid_cards_total": rfid_cards_count,
         "rfid_cards_active": active_rfid_cards,
-        "created_at": user.created_at.isoformat(),
-        "last_login": user.last_login.isoformat() if user.last_login else None
-    }
+        "created_at": user.created_at,
+        "last_login": user.last_login
+    })
 
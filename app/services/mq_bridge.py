@@ -1,85 +1,309 @@
 """
 Message Queue Bridge for Laravel CMS integration
+
+Runs on the server's event loop; uvicorn uses uvloop when it is installed
+(see requirements.txt), which speeds up the bridge's background tasks.
 """
 
 import asyncio
-import json
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional, Callable
-from dataclasses import dataclass, asdict
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Callable, Tuple
 
 import aiohttp
+import msgpack
+import orjson
 import redis.asyncio as redis
+from redis.exceptions import RedisError
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Redis event batching: flush after this many events or this many seconds, whichever comes first
+REDIS_BATCH_MAX = 50
+REDIS_BATCH_WINDOW = 0.005
+
+# HTTP event batching for the Laravel /ocpp/events/batch endpoint
+HTTP_BATCH_MAX = 100
+HTTP_BATCH_WINDOW = 0.01
+
+# Payload fields sent for each event type by the send_* helpers
+EVENT_SCHEMAS: Dict[str, Tuple[str, ...]] = {
+    "boot_notification": ("vendor", "model", "serial_number", "firmware_version"),
+    "transaction_start": ("transaction_id", "connector_id", "id_tag", "user_id", "start_time", "meter_start"),
+    "transaction_stop": ("transaction_id", "connector_id", "id_tag", "user_id", "stop_time", "duration", "energy_delivered", "cost", "meter_stop"),
+    "status_notification": ("connector_id", "status", "error_code"),
+    "meter_values": ("transaction_id", "connector_id", "meter_value", "timestamp"),
+    "heartbeat": ("timestamp", "status"),
+    "fault_notification": ("connector_id", "error_code", "info", "timestamp"),
+    "remote_command_result": ("command", "message_id", "status", "response", "timestamp"),
+    "local_list_updated": ("list_version", "old_version", "update_type", "timestamp"),
+    "local_list_version_retrieved": ("list_version", "old_version", "timestamp")
+}
+
+# In-process queue bounds; beyond these, telemetry events are dropped
+EVENT_QUEUE_MAXSIZE = 10_000
+
+# Events that wait for queue space instead of being dropped when the queue is full
+CRITICAL_EVENTS = frozenset({"transaction_start", "transaction_stop", "boot_notification"})
+
+# Extra backlog commands fetched alongside each BRPOP
+COMMAND_DRAIN_MAX = 64
+
+# Per-event failure logs allowed per minute; the rest are counted and summarized
+ERROR_LOG_LIMIT = 20
+ERROR_LOG_WINDOW = 60
+
+# Redis connection pools: one shared by publishers, the cache and health checks,
+# and a small one for the command consumer's blocking BRPOP
+REDIS_MAX_CONNECTIONS = 32
+REDIS_BLOCKING_MAX_CONNECTIONS = 2
+
+# Health checks run from the message processor loop
+HEALTH_CHECK_INTERVAL = 60
+HEALTH_CHECK_TIMEOUT = 10
+
+async def fill_batch(queue: asyncio.Queue, batch: List[Any], max_size: int, window: float):
+    """Append items from queue to batch until it holds max_size items or the window elapses"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + window
+    while len(batch) < max_size:
+        try:
+            batch.append(queue.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+        
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+
+def msgpack_default(obj: Any) -> Any:
+    """Encode datetimes as ISO 8601 strings, matching the JSON transport"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+def encode_msgpack(obj: Any) -> bytes:
+    return msgpack.packb(obj, default=msgpack_default, use_bin_type=True)
+
+def decode_redis_message(data: bytes) -> Any:
+    """Decode a Redis queue message sent as either JSON or msgpack"""
+    # JSON messages are objects or arrays; msgpack maps never start with '{' (0x7b) or '['
+    if data[:1] in (b"{", b"["):
+        return orjson.loads(data)
+    return msgpack.unpackb(data, raw=False)
+
+def drain_queue(queue: asyncio.Queue) -> List[Any]:
+    """Remove and return everything currently in queue without waiting"""
+    items = []
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return items
+
 class EventMessage:
     """Event message for Laravel CMS"""
-    event_type: str
-    charger_id: str
-    data: Dict[str, Any]
-    timestamp: datetime
-    source: str = "ocpp_service"
+    __slots__ = ("event_type", "charger_id", "data", "timestamp", "source")
+    
+    def __init__(self, event_type: str, charger_id: str, data: Dict[str, Any],
+                 timestamp: datetime, source: str = "ocpp_service"):
+        self.event_type = event_type
+        self.charger_id = charger_id
+        self.data = data
+        self.timestamp = timestamp
+        self.source = source
+    
+    def to_payload(self) -> Dict[str, Any]:
+        """Build the event payload without deep-copying data"""
+        return {
+            "event_type": self.event_type,
+            "charger_id": self.charger_id,
+            "data": self.data,
+            "timestamp": self.timestamp,
+            "source": self.source
+        }
 
 class MQBridge:
     """Message Queue Bridge for Laravel CMS integration"""
     
-    def __init__(self):
+    def __init__(self, use_redis: bool = True):
+        # Without Redis the bridge is HTTP-only: no fallback queue and no command queue
+        self.use_redis = use_redis
         self.redis_client: Optional[redis.Redis] = None
-        self.http_session: Optional[aiohttp.ClientSession] = None
+        # Separate client for BRPOP so a parked connection never holds a publisher's slot
+        self.redis_blocking_client: Optional[redis.Redis] = None
+        # aiohttp.ClientSession, or httpx.AsyncClient when CMS_HTTP_CLIENT is "httpx"
+        self.http_session: Optional[Any] = None
+        self.http_client_kind = "aiohttp"
         
         # Event handlers
         self.event_handlers: Dict[str, Callable] = {}
         
+        # Laravel command type -> processor
+        self._command_handlers: Dict[str, Callable] = {
+            "RemoteStartTransaction": self.process_remote_start,
+            "RemoteStopTransaction": self.process_remote_stop,
+            "UnlockConnector": self.process_unlock_connector,
+            "Reset": self.process_reset,
+            "ChangeConfiguration": self.process_change_configuration
+        }
+        
+        # Endpoints and queue names, built once instead of per event
+        self._events_url = f"{settings.LARAVEL_API_URL}/ocpp/events"
+        self._events_batch_url = f"{self._events_url}/batch"
+        self._health_url = f"{settings.LARAVEL_API_URL}/health"
+        self._redis_events_queue = f"{settings.MQ_EXCHANGE}:events"
+        self._redis_cmds_queue = f"{settings.MQ_EXCHANGE}:commands"
+        self._redis_responses_prefix = f"{settings.MQ_EXCHANGE}:responses:"
+        
+        # Encoding for messages this bridge pushes to Redis; incoming commands may use either
+        self._redis_encode: Callable[[Any], bytes] = encode_msgpack if settings.MQ_REDIS_ENCODING == "msgpack" else orjson.dumps
+        
+        # Outgoing events, posted to Laravel in batches by http_flush_loop
+        self._http_queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE_MAXSIZE)
+        # Cleared if Laravel doesn't expose the batch endpoint; events are then posted one by one
+        self.http_batch_supported = True
+        
+        # Outgoing Redis events as (queue_name, body), flushed in batches by redis_flush_loop
+        self._redis_queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE_MAXSIZE)
+        
         # Background tasks
         self.message_processor_task = None
-        self.health_check_task = None
-        
-        # Statistics
-        self.stats = {
-            "events_sent": 0,
-            "events_failed": 0,
-            "http_requests": 0,
-            "http_errors": 0,
-            "queue_size": 0
-        }
+        self.http_flush_task = None
+        self.redis_flush_task = None
+        
+        # Exceptions expected from the Laravel uplink; extended when httpx is in use
+        self._http_exceptions: Tuple[type, ...] = (aiohttp.ClientError, asyncio.TimeoutError)
+        
+        # Error log rate limiting
+        self._error_log_window_start = time.monotonic()
+        self._error_log_count = 0
+        self._suppressed_error_logs = 0
+        
+        # Statistics, kept as plain attributes so the per-event increments are a single attribute store
+        self.events_sent = 0
+        self.events_failed = 0
+        self.events_dropped = 0
+        self.http_requests = 0
+        self.http_errors = 0
+        self.queue_size = 0
     
     async def start(self):
         """Start the message queue bridge"""
-        try:
-            # Initialize Redis connection
-            self.redis_client = redis.from_url(settings.REDIS_URL)
-            await self.redis_client.ping()
-            logger.info("Redis connection established")
-        except Exception as e:
-            logger.warning(f"Redis connection failed: {e}")
-            logger.info("MQ Bridge will run without Redis (HTTP-only mode)")
-            self.redis_client = None
+        loop = asyncio.get_running_loop()
+        if hasattr(asyncio, "eager_task_factory") and loop.get_task_factory() is None:
+            # Python 3.12+: new tasks run inline until they first block, so sends that
+            # finish immediately (e.g. a queue put) never round-trip through the scheduler
+            loop.set_task_factory(asyncio.eager_task_factory)
+        
+        if self.use_redis:
+            try:
+                # Initialize Redis connection
+                self.redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(
+                    settings.REDIS_URL,
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    socket_keepalive=True,
+                    health_check_interval=30
+                ))
+                await self.redis_client.ping()
+                self.redis_blocking_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(
+                    settings.REDIS_URL,
+                    max_connections=REDIS_BLOCKING_MAX_CONNECTIONS,
+                    socket_keepalive=True
+                ))
+                logger.info("Redis connection established")
+            except Exception as e:
+                logger.warning(f"Redis connection failed: {e}")
+                logger.info("MQ Bridge will run without Redis (HTTP-only mode)")
+                self.redis_client = None
+                self.redis_blocking_client = None
         
         try:
-            # Initialize HTTP session
-            self.http_session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=30),
-                headers={
-                    "Authorization": f"Bearer {settings.LARAVEL_API_KEY}",
-                    "Content-Type": "application/json"
-                }
-            )
+            self.http_session = self.create_http_session()
             
             # Start background tasks
             self.message_processor_task = asyncio.create_task(self.message_processor())
-            self.health_check_task = asyncio.create_task(self.health_check())
+            self.http_flush_task = asyncio.create_task(self.http_flush_loop())
+            self.redis_flush_task = asyncio.create_task(self.redis_flush_loop())
             
-            logger.info("Message Queue Bridge started")
+            if self.use_redis:
+                logger.info("Message Queue Bridge started")
+            else:
+                logger.info("Simple Message Queue Bridge started (without Redis)")
             
         except Exception as e:
             logger.error(f"Failed to start MQ Bridge: {e}")
             # Don't raise exception, just log the error
             logger.warning("MQ Bridge will run in limited mode")
     
+    def create_http_session(self):
+        """Create the HTTP client used for the Laravel uplink"""
+        headers = {
+            "Authorization": f"Bearer {settings.LARAVEL_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        if settings.CMS_HTTP_CLIENT == "httpx":
+            try:
+                import httpx
+                
+                # HTTP/2 multiplexes all event posts over one TLS connection to Laravel
+                client = httpx.AsyncClient(
+                    http2=True,
+                    timeout=30.0,
+                    headers=headers,
+                    limits=httpx.Limits(max_keepalive_connections=16, max_connections=64, keepalive_expiry=75)
+                )
+                self.http_client_kind = "httpx"
+                self._http_exceptions = (httpx.HTTPError, asyncio.TimeoutError)
+                logger.info("Laravel uplink using httpx (HTTP/2)")
+                return client
+            except ImportError as e:
+                logger.warning(f"httpx HTTP/2 client unavailable ({e}), falling back to aiohttp")
+        
+        # Keep connections to the Laravel host alive (nginx default keepalive is 75s)
+        # so events don't pay a new TLS handshake
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=64,
+            keepalive_timeout=75,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        self.http_client_kind = "aiohttp"
+        self._http_exceptions = (aiohttp.ClientError, asyncio.TimeoutError)
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30),
+            headers=headers
+        )
+    
+    async def http_post(self, url: str, body: bytes) -> int:
+        """POST a pre-serialized JSON body and return the response status"""
+        if self.http_client_kind == "httpx":
+            response = await self.http_session.post(url, content=body)
+            return response.status_code
+        
+        async with self.http_session.post(url, data=body) as response:
+            return response.status
+    
+    async def http_get(self, url: str) -> int:
+        """GET url and return the response status"""
+        if self.http_client_kind == "httpx":
+            response = await self.http_session.get(url)
+            return response.status_code
+        
+        async with self.http_session.get(url) as response:
+            return response.status
+    
     async def stop(self):
         """Stop the message queue bridge"""
         logger.info("Stopping Message Queue Bridge...")
@@ -87,174 +311,315 @@ class MQBridge:
         # Cancel background tasks
         if self.message_processor_task:
             self.message_processor_task.cancel()
-        if self.health_check_task:
-            self.health_check_task.cancel()
+        if self.http_flush_task:
+            # Deliver queued events first; failures fall back to the Redis queue
+            self.http_flush_task.cancel()
+            await asyncio.gather(self.http_flush_task, return_exceptions=True)
+        if self.redis_flush_task:
+            # Let the flusher push any queued events before the connection closes
+            self.redis_flush_task.cancel()
+            await asyncio.gather(self.redis_flush_task, return_exceptions=True)
         
         # Close connections
-        if self.redis_client:
-            await self.redis_client.close()
+        # Clients built on an explicit pool don't close it themselves
+        for client in (self.redis_blocking_client, self.redis_client):
+            if client:
+                await client.close()
+                await client.connection_pool.disconnect()
         
         if self.http_session:
-            await self.http_session.close()
+            if self.http_client_kind == "httpx":
+                await self.http_session.aclose()
+            else:
+                await self.http_session.close()
         
         logger.info("Message Queue Bridge stopped")
     
+    def should_log_error(self) -> bool:
+        """Rate-limit per-event failure logs so an outage doesn't flood the log"""
+        now = time.monotonic()
+        if now - self._error_log_window_start >= ERROR_LOG_WINDOW:
+            if self._suppressed_error_logs:
+                logger.warning("%d MQ bridge errors suppressed in the last minute", self._suppressed_error_logs)
+            self._error_log_window_start = now
+            self._error_log_count = 0
+            self._suppressed_error_logs = 0
+        
+        if self._error_log_count < ERROR_LOG_LIMIT:
+            self._error_log_count += 1
+            return True
+        
+        self._suppressed_error_logs += 1
+        return False
+    
     async def send_event(self, event_type: str, charger_id: str, data: Dict[str, Any]):
         """Send event to Laravel CMS"""
+        await self.send_events([(event_type, charger_id, data)])
+    
+    async def send_events(self, events: List[Tuple[str, str, Dict[str, Any]]]):
+        """Send several (event_type, charger_id, data) events to Laravel CMS in one go"""
+        timestamp = datetime.now(timezone.utc)
+        messages = [
+            EventMessage(event_type=event_type, charger_id=charger_id, data=data, timestamp=timestamp)
+            for event_type, charger_id, data in events
+        ]
         try:
-            event = EventMessage(
-                event_type=event_type,
-                charger_id=charger_id,
-                data=data,
-                timestamp=datetime.utcnow()
-            )
-            
-            # Try HTTP first, fallback to Redis queue
-            success = await self.send_via_http(event)
+            if self.http_flush_task:
+                # Delivered by http_flush_loop together with other pending events
+                for event in messages:
+                    if event.event_type in CRITICAL_EVENTS:
+                        await self._http_queue.put(event)
+                    else:
+                        try:
+                            self._http_queue.put_nowait(event)
+                        except asyncio.QueueFull:
+                            # Laravel is falling behind; shed telemetry rather than grow without bound
+                            self.events_dropped += 1
+            elif messages:
+                # No flush loop running; deliver the whole group as a single batch
+                await self.deliver_events(messages)
             
-            if not success:
-                await self.send_via_redis(event)
+        except Exception as e:
+            if self.should_log_error():
+                logger.error("Failed to send %d event(s): %s", len(messages), e)
+            self.events_failed += len(messages)
+    
+    async def deliver_events(self, events: List[EventMessage]):
+        """Deliver events over HTTP, falling back to the Redis queue"""
+        encoded = self.encode_events(events)
+        if not encoded:
+            return
+        
+        if self.http_batch_supported:
+            if await self.send_batch_via_http([body for _, body in encoded]):
+                self.events_sent += len(encoded)
+                return
             
-            self.stats["events_sent"] += 1
+            if self.http_batch_supported:
+                # Batch rejected by Laravel
+                await self.queue_undelivered([event for event, _ in encoded])
+                return
+        
+        # Try HTTP first, fallback to Redis queue
+        for event, body in encoded:
+            success = await self.send_via_http(event, body)
             
-        except Exception as e:
-            logger.error(f"Failed to send event {event_type} for {charger_id}: {e}")
-            self.stats["events_failed"] += 1
+            if success:
+                self.events_sent += 1
+            else:
+                await self.queue_undelivered([event])
     
-    async def send_via_http(self, event: EventMessage) -> bool:
-        """Send event via HTTP to Laravel CMS"""
+    async def queue_undelivered(self, events: List[EventMessage]):
+        """Queue events HTTP couldn't deliver in Redis; without Redis they count as failed"""
+        if not self.use_redis:
+            self.events_failed += len(events)
+            if self.should_log_error():
+                logger.warning("Failed to send %d events over HTTP", len(events))
+            return
+        
+        for event in events:
+            # Drops and failures are counted by send_via_redis itself
+            if await self.send_via_redis(event):
+                self.events_sent += 1
+    
+    def encode_events(self, events: List[EventMessage]) -> List[Tuple[EventMessage, bytes]]:
+        """Serialize each event on its own, counting unserializable ones as failed instead of the whole batch"""
+        encoded = []
+        for event in events:
+            try:
+                encoded.append((event, orjson.dumps(event.to_payload())))
+            except orjson.JSONEncodeError as e:
+                if self.should_log_error():
+                    logger.error("Dropping unserializable %s event for %s: %s", event.event_type, event.charger_id, e)
+                self.events_failed += 1
+        return encoded
+    
+    async def send_batch_via_http(self, bodies: List[bytes]) -> bool:
+        """Send a batch of serialized events via a single HTTP request to Laravel CMS"""
         try:
-            url = f"{settings.LARAVEL_API_URL}/ocpp/events"
-            payload = asdict(event)
-            payload["timestamp"] = event.timestamp.isoformat()
+            url = self._events_batch_url
             
-            async with self.http_session.post(url, json=payload) as response:
-                self.stats["http_requests"] += 1
+            status = await self.http_post(url, b'{"events":[' + b",".join(bodies) + b"]}")
+            self.http_requests += 1
+            
+            if status == 200:
+                logger.debug("%d events sent via HTTP batch", len(bodies))
+                return True
+            
+            if status in (404, 405):
+                logger.warning("Laravel batch endpoint unavailable, sending events individually")
+                self.http_batch_supported = False
+            else:
+                if self.should_log_error():
+                    logger.warning("HTTP batch request failed with status %s", status)
+                self.http_errors += 1
+            return False
+                    
+        except self._http_exceptions as e:
+            if self.should_log_error():
+                logger.error("HTTP batch request failed: %s", e)
+            self.http_errors += 1
+            return False
+    
+    async def http_flush_loop(self):
+        """Background task to post queued events to Laravel in batches"""
+        batch: List[EventMessage] = []
+        while True:
+            try:
+                batch.append(await self._http_queue.get())
+                await fill_batch(self._http_queue, batch, HTTP_BATCH_MAX, HTTP_BATCH_WINDOW)
+                await self.deliver_events(batch)
+                batch = []
+                # Yield so a constantly full queue can't starve other tasks
+                await asyncio.sleep(0)
                 
-                if response.status == 200:
-                    logger.debug(f"Event sent via HTTP: {event.event_type}")
-                    return True
-                else:
-                    logger.warning(f"HTTP request failed with status {response.status}")
-                    self.stats["http_errors"] += 1
-                    return False
+            except asyncio.CancelledError:
+                # Deliver whatever is still pending before shutting down
+                pending = batch + drain_queue(self._http_queue)
+                if pending:
+                    await self.deliver_events(pending)
+                break
+            except Exception as e:
+                logger.error(f"Error in HTTP flush loop: {e}")
+                self.events_failed += len(batch)
+                batch = []
+    
+    async def send_via_http(self, event: EventMessage, body: bytes) -> bool:
+        """Send a serialized event via HTTP to Laravel CMS"""
+        try:
+            url = self._events_url
+            
+            status = await self.http_post(url, body)
+            self.http_requests += 1
+            
+            if status == 200:
+                logger.debug("Event sent via HTTP: %s", event.event_type)
+                return True
+            else:
+                if self.should_log_error():
+                    logger.warning("HTTP request failed with status %s", status)
+                self.http_errors += 1
+                return False
                     
-        except Exception as e:
-            logger.error(f"HTTP request failed: {e}")
-            self.stats["http_errors"] += 1
+        except self._http_exceptions as e:
+            if self.should_log_error():
+                logger.error("HTTP request failed: %s", e)
+            self.http_errors += 1
             return False
     
-    async def send_via_redis(self, event: EventMessage):
-        """Send event via Redis queue"""
+    async def send_via_redis(self, event: EventMessage) -> bool:
+        """Send event via Redis queue, returning whether it was queued"""
         if not self.redis_client:
-            logger.warning("Redis not available, skipping Redis queue")
-            return
+            if self.should_log_error():
+                logger.warning("Redis not available, skipping Redis queue")
+            self.events_failed += 1
+            return False
             
         try:
-            queue_name = f"{settings.MQ_EXCHANGE}:events"
-            payload = asdict(event)
-            payload["timestamp"] = event.timestamp.isoformat()
+            queue_name = self._redis_events_queue
+            payload = event.to_payload()
             
-            await self.redis_client.lpush(queue_name, json.dumps(payload))
-            logger.debug(f"Event queued via Redis: {event.event_type}")
+            # Pushed to Redis by redis_flush_loop together with other pending events
+            item = (queue_name, self._redis_encode(payload))
+            if event.event_type in CRITICAL_EVENTS:
+                await self._redis_queue.put(item)
+            else:
+                try:
+                    self._redis_queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    self.events_dropped += 1
+                    return False
+            logger.debug("Event queued via Redis: %s", event.event_type)
+            return True
             
-        except Exception as e:
-            logger.error(f"Redis queue failed: {e}")
+        except TypeError as e:
+            if self.should_log_error():
+                logger.error("Redis queue failed: %s", e)
             # Don't raise exception, just log the error
+            self.events_failed += 1
+            return False
+    
+    async def flush_redis_batch(self, batch: List[Tuple[str, bytes]]):
+        """Push a batch of events to Redis in a single round-trip"""
+        if not batch or not self.redis_client:
+            return
+        
+        # One variadic LPUSH per queue keeps the events in the order they were sent
+        grouped: Dict[str, List[bytes]] = {}
+        for queue_name, body in batch:
+            grouped.setdefault(queue_name, []).append(body)
+        
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for queue_name, bodies in grouped.items():
+                    pipe.lpush(queue_name, *bodies)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            if self.should_log_error():
+                logger.error("Redis queue failed for %d events: %s", len(batch), e)
+    
+    async def redis_flush_loop(self):
+        """Background task to push queued events to Redis in batches"""
+        batch: List[Tuple[str, bytes]] = []
+        while True:
+            try:
+                batch.append(await self._redis_queue.get())
+                await fill_batch(self._redis_queue, batch, REDIS_BATCH_MAX, REDIS_BATCH_WINDOW)
+                await self.flush_redis_batch(batch)
+                batch = []
+                await asyncio.sleep(0)
+                
+            except asyncio.CancelledError:
+                # Flush whatever is still pending before shutting down
+                await self.flush_redis_batch(batch + drain_queue(self._redis_queue))
+                break
+            except Exception as e:
+                logger.error(f"Error in Redis flush loop: {e}")
+                batch = []
+    
+    async def emit(self, event_type: str, charger_id: str, source: Dict[str, Any]):
+        """Send an event carrying the EVENT_SCHEMAS fields of event_type taken from source"""
+        await self.send_event(event_type, charger_id, {key: source.get(key) for key in EVENT_SCHEMAS[event_type]})
     
     async def send_boot_notification(self, charger_id: str, charger_data: Dict[str, Any]):
         """Send boot notification event"""
-        await self.send_event("boot_notification", charger_id, {
-            "vendor": charger_data.get("vendor"),
-            "model": charger_data.get("model"),
-            "serial_number": charger_data.get("serial_number"),
-            "firmware_version": charger_data.get("firmware_version")
-        })
+        await self.emit("boot_notification", charger_id, charger_data)
     
     async def send_transaction_start(self, charger_id: str, session_data: Dict[str, Any]):
         """Send transaction start event"""
-        await self.send_event("transaction_start", charger_id, {
-            "transaction_id": session_data.get("transaction_id"),
-            "connector_id": session_data.get("connector_id"),
-            "id_tag": session_data.get("id_tag"),
-            "user_id": session_data.get("user_id"),
-            "start_time": session_data.get("start_time"),
-            "meter_start": session_data.get("meter_start")
-        })
+        await self.emit("transaction_start", charger_id, session_data)
     
     async def send_transaction_stop(self, charger_id: str, session_data: Dict[str, Any]):
         """Send transaction stop event"""
-        await self.send_event("transaction_stop", charger_id, {
-            "transaction_id": session_data.get("transaction_id"),
-            "connector_id": session_data.get("connector_id"),
-            "id_tag": session_data.get("id_tag"),
-            "user_id": session_data.get("user_id"),
-            "stop_time": session_data.get("stop_time"),
-            "duration": session_data.get("duration"),
-            "energy_delivered": session_data.get("energy_delivered"),
-            "cost": session_data.get("cost"),
-            "meter_stop": session_data.get("meter_stop")
-        })
+        await self.emit("transaction_stop", charger_id, session_data)
     
     async def send_status_notification(self, charger_id: str, status_data: Dict[str, Any]):
         """Send status notification event"""
-        await self.send_event("status_notification", charger_id, {
-            "connector_id": status_data.get("connector_id"),
-            "status": status_data.get("status"),
-            "error_code": status_data.get("error_code")
-        })
+        await self.emit("status_notification", charger_id, status_data)
     
     async def send_meter_values(self, charger_id: str, meter_data: Dict[str, Any]):
         """Send meter values event"""
-        await self.send_event("meter_values", charger_id, {
-            "transaction_id": meter_data.get("transaction_id"),
-            "connector_id": meter_data.get("connector_id"),
-            "meter_value": meter_data.get("meter_value"),
-            "timestamp": meter_data.get("timestamp")
-        })
+        await self.emit("meter_values", charger_id, meter_data)
     
     async def send_heartbeat(self, charger_id: str, heartbeat_data: Dict[str, Any]):
         """Send heartbeat event"""
-        await self.send_event("heartbeat", charger_id, {
-            "timestamp": heartbeat_data.get("timestamp"),
-            "status": heartbeat_data.get("status")
-        })
+        await self.emit("heartbeat", charger_id, heartbeat_data)
     
     async def send_fault_notification(self, charger_id: str, fault_data: Dict[str, Any]):
         """Send fault notification event"""
-        await self.send_event("fault_notification", charger_id, {
-            "connector_id": fault_data.get("connector_id"),
-            "error_code": fault_data.get("error_code"),
-            "info": fault_data.get("info"),
-            "timestamp": fault_data.get("timestamp")
-        })
+        await self.emit("fault_notification", charger_id, fault_data)
     
     async def send_remote_command_result(self, charger_id: str, command_data: Dict[str, Any]):
         """Send remote command result event"""
-        await self.send_event("remote_command_result", charger_id, {
-            "command": command_data.get("command"),
-            "message_id": command_data.get("message_id"),
-            "status": command_data.get("status"),
-            "response": command_data.get("response"),
-            "timestamp": command_data.get("timestamp")
-        })
+        await self.emit("remote_command_result", charger_id, command_data)
     
     async def send_local_list_updated(self, charger_id: str, list_data: Dict[str, Any]):
         """Send local list updated event"""
-        await self.send_event("local_list_updated", charger_id, {
-            "list_version": list_data.get("list_version"),
-            "old_version": list_data.get("old_version"),
-            "update_type": list_data.get("update_type"),
-            "timestamp": list_data.get("timestamp")
-        })
+        await self.emit("local_list_updated", charger_id, list_data)
     
     async def send_local_list_version_retrieved(self, charger_id: str, version_data: Dict[str, Any]):
         """Send local list version retrieved event"""
-        await self.send_event("local_list_version_retrieved", charger_id, {
-            "list_version": version_data.get("list_version"),
-            "old_version": version_data.get("old_version"),
-            "timestamp": version_data.get("timestamp")
-        })
+        await self.emit("local_list_version_retrieved", charger_id, version_data)
     
     async def receive_command(self, command_data: Dict[str, Any]) -> Dict[str, Any]:
         """Receive command from Laravel CMS"""
@@ -264,18 +629,11 @@ class MQBridge:
             payload = command_data.get("payload", {})
             
             # Process command based on type
-            if command_type == "RemoteStartTransaction":
-                return await self.process_remote_start(charger_id, payload)
-            elif command_type == "RemoteStopTransaction":
-                return await self.process_remote_stop(charger_id, payload)
-            elif command_type == "UnlockConnector":
-                return await self.process_unlock_connector(charger_id, payload)
-            elif command_type == "Reset":
-                return await self.process_reset(charger_id, payload)
-            elif command_type == "ChangeConfiguration":
-                return await self.process_change_configuration(charger_id, payload)
-            else:
+            handler = self._command_handlers.get(command_type)
+            if handler is None:
                 return {"status": "error", "message": f"Unknown command: {command_type}"}
+            
+            return await handler(charger_id, payload)
                 
         except Exception as e:
             logger.error(f"Error processing command: {e}")
@@ -307,29 +665,75 @@ class MQBridge:
         # TODO: Implement actual configuration change processing
         return {"status": "accepted", "message": "Change configuration command processed"}
     
+    async def drain_commands(self, queue_name: str) -> List[bytes]:
+        """Pop up to COMMAND_DRAIN_MAX more commands from the queue in one round-trip"""
+        # Commands are LPUSHed, so the oldest sit at the tail; take the tail and trim it off atomically
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.lrange(queue_name, -COMMAND_DRAIN_MAX, -1)
+            pipe.ltrim(queue_name, 0, -COMMAND_DRAIN_MAX - 1)
+            extras, _ = await pipe.execute()
+        
+        # LRANGE lists newest first; process oldest first like BRPOP does
+        extras.reverse()
+        return extras
+    
+    async def process_command_message(self, message_data: bytes) -> Optional[Tuple[str, bytes]]:
+        """Process a single command popped from the Redis queue
+        
+        Returns the (response_queue, body) to push if the command requested a response.
+        """
+        try:
+            command_data = decode_redis_message(message_data)
+            
+            # Process command
+            result = await self.receive_command(command_data)
+            
+            # Send result back if requested
+            if command_data.get("require_response"):
+                response_queue = f"{self._redis_responses_prefix}{command_data.get('request_id')}"
+                return response_queue, self._redis_encode(result)
+                
+        except Exception as e:
+            logger.error(f"Error processing queued command: {e}")
+        
+        return None
+    
     async def message_processor(self):
-        """Background task to process messages from Redis queue"""
+        """Background task to process messages from Redis queue and run periodic health checks"""
+        loop = asyncio.get_running_loop()
+        next_health_check = loop.time() + HEALTH_CHECK_INTERVAL
         while True:
             try:
-                if self.redis_client:
-                    # Check for commands from Laravel CMS
-                    queue_name = f"{settings.MQ_EXCHANGE}:commands"
-                    message = await self.redis_client.brpop(queue_name, timeout=1)
+                wait = max(next_health_check - loop.time(), 0)
+                if self.redis_blocking_client:
+                    # Block until Laravel CMS queues a command or the next health check is due;
+                    # cancelling the task on stop() interrupts the wait
+                    queue_name = self._redis_cmds_queue
+                    message = await self.redis_blocking_client.brpop(queue_name, timeout=max(math.ceil(wait), 1))
                     
                     if message:
                         _, message_data = message
-                        command_data = json.loads(message_data)
+                        # Pick up any backlog in the same wakeup instead of one BRPOP per command
+                        messages = [message_data] + await self.drain_commands(queue_name)
                         
-                        # Process command
-                        result = await self.receive_command(command_data)
+                        responses = []
+                        for message_data in messages:
+                            response = await self.process_command_message(message_data)
+                            if response:
+                                responses.append(response)
                         
-                        # Send result back if requested
-                        if command_data.get("require_response"):
-                            response_queue = f"{settings.MQ_EXCHANGE}:responses:{command_data.get('request_id')}"
-                            await self.redis_client.lpush(response_queue, json.dumps(result))
+                        # All responses for the drained batch go out in one pipeline
+                        await self.flush_redis_batch(responses)
                 else:
-                    # No Redis, just sleep
-                    await asyncio.sleep(1)
+                    # No Redis, just wait for the next health check
+                    await asyncio.sleep(wait)
+                
+                if loop.time() >= next_health_check:
+                    try:
+                        await asyncio.wait_for(self.run_health_checks(), HEALTH_CHECK_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        logger.warning("Health check timed out")
+                    next_health_check = loop.time() + HEALTH_CHECK_INTERVAL
                 
             except asyncio.CancelledError:
                 break
@@ -337,46 +741,48 @@ class MQBridge:
                 logger.error(f"Error in message processor: {e}")
                 await asyncio.sleep(1)  # Wait before retrying
     
-    async def health_check(self):
-        """Background task to check system health"""
-        while True:
+    async def run_health_checks(self):
+        """Check Redis and Laravel connectivity and refresh the queue size"""
+        # Check Redis connection
+        if self.redis_client:
             try:
-                await asyncio.sleep(60)  # Check every minute
-                
-                # Check Redis connection
-                if self.redis_client:
-                    try:
-                        await self.redis_client.ping()
-                    except Exception as e:
-                        logger.error(f"Redis health check failed: {e}")
-                
-                # Check HTTP connection to Laravel
-                if self.http_session:
-                    try:
-                        async with self.http_session.get(f"{settings.LARAVEL_API_URL}/health") as response:
-                            if response.status != 200:
-                                logger.warning(f"Laravel health check failed with status {response.status}")
-                    except Exception as e:
-                        logger.warning(f"Laravel health check failed: {e}")
-                
-                # Update queue size
-                if self.redis_client:
-                    try:
-                        queue_name = f"{settings.MQ_EXCHANGE}:events"
-                        self.stats["queue_size"] = await self.redis_client.llen(queue_name)
-                    except Exception as e:
-                        logger.error(f"Failed to get queue size: {e}")
-                else:
-                    self.stats["queue_size"] = 0
-                
-            except asyncio.CancelledError:
-                break
+                await self.redis_client.ping()
+            except Exception as e:
+                logger.error(f"Redis health check failed: {e}")
+        
+        # Check HTTP connection to Laravel
+        if self.http_session:
+            try:
+                status = await self.http_get(self._health_url)
+                if status != 200:
+                    logger.warning(f"Laravel health check failed with status {status}")
             except Exception as e:
-                logger.error(f"Error in health check: {e}")
+                logger.warning(f"Laravel health check failed: {e}")
+        
+        # Update queue size
+        if self.redis_client:
+            try:
+                self.queue_size = await self.redis_client.llen(self._redis_events_queue)
+            except Exception as e:
+                logger.error(f"Failed to get queue size: {e}")
+        else:
+            self.queue_size = 0
+    
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """Bridge statistics as a dict, built on demand"""
+        return {
+            "events_sent": self.events_sent,
+            "events_failed": self.events_failed,
+            "events_dropped": self.events_dropped,
+            "http_requests": self.http_requests,
+            "http_errors": self.http_errors,
+            "queue_size": self.queue_size
+        }
     
     def get_stats(self) -> Dict[str, Any]:
         """Get bridge statistics"""
-        return self.stats.copy()
+        return self.stats
     
     def get_status(self) -> Dict[str, Any]:
         """Get bridge status"""
@@ -384,5 +790,5 @@ class MQBridge:
             "redis_connected": self.redis_client is not None,
             "http_session_active": self.http_session is not None,
             "statistics": self.stats,
-            "mode": "full" if self.redis_client else "http-only"
+            "mode": ("full" if self.redis_client else "http-only") if self.use_redis else "simple"
         }
\ No newline at end of file
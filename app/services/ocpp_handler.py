@@ -1,13 +1,19 @@
 import asyncio
+import heapq
 import json
+import os
+import socket
 import uuid
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from datetime import datetime, timezone, timedelta
-from typing import Dict, Optional, List, Set, Any, Callable
+from typing import Dict, Optional, List, Set, Any, Callable, Tuple
 from dataclasses import dataclass, asdict
-from time import time
-from sqlalchemy import func
+from time import perf_counter, monotonic
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
 
 from app.core.config import get_egypt_now, to_egypt_timezone
 
@@ -38,10 +44,86 @@ from ocpp.v16.enums import (
 from app.models.database import Charger, Connector, Session, MessageLog, ConnectionEvent, SystemConfig, SessionLocal, RFIDCard
 from app.core.config import settings, create_ssl_context
 from app.services.session_manager import SessionManager
-from app.services.mq_bridge import MQBridge
+from app.services.mq_bridge import MQBridge, fill_batch, drain_queue
 
 logger = logging.getLogger(__name__)
 
+# Outgoing frames buffered per charger before send_message_to_charger starts refusing
+CHARGER_SEND_QUEUE_SIZE = 256
+# Frames a charger writer sends per wakeup
+CHARGER_WRITE_BATCH_MAX = 32
+# Forwarded frames buffered per master connection before new ones are dropped for it
+MASTER_SEND_QUEUE_SIZE = 1024
+# MessageLog rows buffered for the log writer; rows beyond this are dropped
+MESSAGE_LOG_QUEUE_SIZE = 10_000
+# Rows per bulk insert and how long the writer waits to fill a batch (seconds)
+MESSAGE_LOG_BATCH_MAX = 500
+MESSAGE_LOG_BATCH_WINDOW = 0.1
+# Seconds a SystemConfig value is served from memory before it is re-read
+SYSTEM_CONFIG_TTL = 300
+# Per-charger retry settings are served from memory for this many seconds, for up to this many chargers
+RETRY_CONFIG_TTL = 30
+RETRY_CONFIG_CACHE_SIZE = 2048
+# RFID card authorization fields are served from memory for this many seconds, for up to this many id_tags
+AUTHORIZE_CACHE_TTL = 60
+AUTHORIZE_CACHE_SIZE = 65_536
+# (charger_id, limit) listings of connection events kept between writes of new events
+CONNECTION_EVENTS_CACHE_SIZE = 256
+# Seconds between flushes of buffered Heartbeat timestamps to the chargers table
+HEARTBEAT_FLUSH_INTERVAL = 2
+# Worker threads for blocking SQLAlchemy calls made from the OCPP coroutines
+DB_EXECUTOR_WORKERS = 8
+# Kernel keepalive for charger sockets: probe after this many idle seconds, every
+# TCP_KEEPALIVE_INTERVAL seconds, and drop the connection after TCP_KEEPALIVE_COUNT misses
+TCP_KEEPALIVE_IDLE = 120
+TCP_KEEPALIVE_INTERVAL = 30
+TCP_KEEPALIVE_COUNT = 3
+# Heartbeat is the most frequent CALL and its reply only varies by id and time
+HEARTBEAT_RESPONSE_TEMPLATE = '[3,%s,{"currentTime":"%s"}]'
+
+def set_tcp_cork(websocket: Any, corked: bool):
+    """Cork/uncork the socket under a websockets connection (Linux only, no-op elsewhere)
+
+    While corked the kernel holds partial segments, so frames written back to back leave
+    in as few packets as possible. Works under TLS too, since it acts on the TCP socket.
+    """
+    transport = getattr(websocket, "transport", None)
+    sock = transport.get_extra_info("socket") if transport else None
+    if sock is None or not hasattr(socket, "TCP_CORK"):
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if corked else 0)
+    except OSError:
+        pass
+
+def set_tcp_keepalive(websocket: Any):
+    """Turn on kernel TCP keepalive for the socket under a websockets connection
+
+    Dead peers are then detected by the kernel instead of by websocket PING frames
+    encoded and decoded in Python. Options the platform lacks are skipped.
+    """
+    transport = getattr(websocket, "transport", None)
+    sock = transport.get_extra_info("socket") if transport else None
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", TCP_KEEPALIVE_IDLE),
+                              ("TCP_KEEPINTVL", TCP_KEEPALIVE_INTERVAL),
+                              ("TCP_KEEPCNT", TCP_KEEPALIVE_COUNT)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+    except OSError:
+        pass
+
+def new_connection_id() -> str:
+    """Random id correlating one charger connection's events; not security sensitive"""
+    return os.urandom(8).hex()
+
+def new_message_id() -> str:
+    """Stand-in id for log rows and replies to frames that carry no message id of their own"""
+    return os.urandom(8).hex()
+
 def to_camel_case(snake_str: str) -> str:
     """Convert snake_case to camelCase"""
     components = snake_str.split('_')
@@ -58,20 +140,33 @@ def dict_to_camelcase(data: Any) -> Any:
     else:
         return data
 
+def dumps_text(obj: Any) -> str:
+    """Serialize to a JSON str with orjson; OCPP-J frames must go out as TEXT, not bytes"""
+    return orjson.dumps(obj, default=str).decode()
+
+def dumps_response(action: str, response: List[Any]) -> str:
+    """Serialize a reply to a charger CALL, filling the Heartbeat template instead of encoding it"""
+    if action == "Heartbeat" and response[0] == 3:
+        return HEARTBEAT_RESPONSE_TEMPLATE % (dumps_text(response[1]), response[2]["currentTime"])
+    return dumps_text(response)
+
 def asdict_camelcase(obj) -> Dict[str, Any]:
     """Convert dataclass to dict with camelCase keys"""
     return dict_to_camelcase(asdict(obj))
 
-@dataclass
+@dataclass(slots=True)
 class PendingMessage:
     message_id: str
     charger_id: str
     action: str
     payload: Dict[str, Any]
-    timestamp: datetime
+    timestamp: float  # time.monotonic() when the CALL was first sent
     retry_count: int = 0
+    # Retry policy resolved for the charger when the CALL is sent
     max_retries: int = 3
-    last_send_attempt: Optional[datetime] = None
+    retry_interval: int = 5
+    retry_enabled: bool = True
+    last_send_attempt: Optional[float] = None  # time.monotonic() of the latest retry
     send_successful: bool = False
     callback: Optional[Callable] = None
     response_received: bool = False  # Track if charging point responded
@@ -83,15 +178,41 @@ class OCPPHandler:
         self.mq_bridge = mq_bridge
         self.charger_connections: Dict[str, WebSocketServerProtocol] = {}
         self.connection_ids: Dict[str, str] = {}
+        # Outgoing frames per charger, drained by that charger's writer task
+        self.charger_send_queues: Dict[str, asyncio.Queue] = {}
+        self.charger_writer_tasks: Dict[str, asyncio.Task] = {}
         self.transaction_counters: Dict[str, int] = {}  # Track transaction counters per charger
+        # Last (status, error_code) stored per charger and connector, so repeated StatusNotifications skip the DB
+        self.connector_states: Dict[str, Dict[int, Tuple[Optional[str], Optional[str]]]] = {}
         self.master_connections: Set[WebSocketServerProtocol] = set()
-        self.message_queue: asyncio.Queue = asyncio.Queue()
-        self.pending_messages: Dict[str, PendingMessage] = {}
+        # Forwarded frames per master, drained by that master's writer task
+        self.master_send_queues: Dict[WebSocketServerProtocol, asyncio.Queue] = {}
+        # MessageLog rows waiting to be bulk-inserted by message_log_writer
+        self.message_log_queue: asyncio.Queue = asyncio.Queue(maxsize=MESSAGE_LOG_QUEUE_SIZE)
+        self.message_log_task = None
+        # get_connection_events results by (charger_id, limit); events are append-only, so the
+        # cache stays valid until a connect, disconnect or timeout writes new ConnectionEvent rows
+        self.connection_events_cache: Dict[Tuple[Optional[str], int], List[Dict[str, Any]]] = {}
+        # Latest Heartbeat time per charger, written to the DB in one batch every HEARTBEAT_FLUSH_INTERVAL
+        self.heartbeat_buffer: Dict[str, datetime] = {}
+        self.heartbeat_flush_task = None
+        # Blocking DB writes on hot paths run here so they don't stall the event loop
+        self.db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="ocpp-db")
+        # Outstanding CALLs awaiting a response, sharded by charger: charger_id -> {message_id: PendingMessage}
+        self.pending_by_charger: Dict[str, Dict[str, PendingMessage]] = {}
+        # Retry deadlines as (monotonic due time, charger_id, message_id), soonest first
+        self.retry_heap: List[Tuple[float, str, str]] = []
+        self.retry_wakeup = asyncio.Event()
+        # SystemConfig values by key, as (monotonic load time, value); read-mostly, so cached for SYSTEM_CONFIG_TTL
+        self.system_config_cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        # Resolved retry settings by charger, as (monotonic load time, config); oldest entries evicted first
+        self.retry_config_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        # RFID card (is_blocked, is_active, expires_at) by id_tag, or None for unknown tags, as
+        # (monotonic load time, card); least recently used entries evicted first
+        self.authorize_cache: Dict[str, Tuple[float, Optional[Tuple[bool, bool, Optional[datetime]]]]] = {}
         self.server = None
-        self.message_processor_task = None
         self.retry_task = None
         self.heartbeat_task = None
-        self.keepalive_task = None
         self.stats = {
             "messages_sent": 0,
             "messages_received": 0,
@@ -100,7 +221,45 @@ class OCPPHandler:
             "connections_active": 0,
             "master_connections": 0,
             "pending_messages": 0,
-            "messages_forwarded": 0  # New metric for forwarded messages
+            "messages_forwarded": 0,  # New metric for forwarded messages
+            "master_messages_dropped": 0,
+            "message_logs_dropped": 0
+        }
+        # Action -> handler tables, built once so dispatch is a single dict lookup
+        self._incoming_handlers: Dict[str, Callable] = {
+            "Authorize": self.handle_authorize,
+            "BootNotification": self.handle_boot_notification,
+            "CancelReservation": self.handle_cancel_reservation,
+            "DataTransfer": self.handle_data_transfer,
+            "DiagnosticsStatusNotification": self.handle_diagnostics_status_notification,
+            "FirmwareStatusNotification": self.handle_firmware_status_notification,
+            "GetCompositeSchedule": self.handle_get_composite_schedule,
+            "Heartbeat": self.handle_heartbeat,
+            "RemoteStartTransaction": self.handle_remote_start_transaction,
+            "RemoteStopTransaction": self.handle_remote_stop_transaction,
+            "ReserveNow": self.handle_reserve_now,
+            "MeterValues": self.handle_meter_values,
+            "StartTransaction": self.handle_start_transaction,
+            "StatusNotification": self.handle_status_notification,
+            "StopTransaction": self.handle_stop_transaction,
+            "TriggerMessage": self.handle_trigger_message,
+        }
+        self._result_handlers: Dict[str, Callable] = {
+            "ChangeAvailability": self.on_change_availability_response,
+            "ChangeConfiguration": self.on_change_configuration_response,
+            "ClearCache": self.on_clear_cache_response,
+            "ClearChargingProfile": self.on_clear_charging_profile_response,
+            "GetConfiguration": self.on_get_configuration_response,
+            "GetDiagnostics": self.on_get_diagnostics_response,
+            "GetLocalListVersion": self.on_get_local_list_version_response,
+            "RemoteStartTransaction": self.on_remote_start_transaction_response,
+            "RemoteStopTransaction": self.on_remote_stop_transaction_response,
+            "Reset": self.on_reset_response,
+            "SendLocalList": self.on_send_local_list_response,
+            "SetChargingProfile": self.on_set_charging_profile_response,
+            "TriggerMessage": self.on_trigger_message_response,
+            "UnlockConnector": self.on_unlock_connector_response,
+            "UpdateFirmware": self.on_update_firmware_response,
         }
 
     async def start_websocket_server(self):
@@ -112,22 +271,31 @@ class OCPPHandler:
             settings.OCPP_WEBSOCKET_HOST,
             settings.OCPP_WEBSOCKET_PORT,
             subprotocols=settings.OCPP_SUBPROTOCOLS,
-            ping_interval=120,
-            ping_timeout=30,
+            # Liveness comes from OCPP Heartbeats and TCP keepalive (set per charger socket)
+            ping_interval=None,
+            ping_timeout=None,
             close_timeout=10,
             max_size=1024 * 1024,
             ssl=ssl_context
         )
-        self.message_processor_task = asyncio.create_task(self.message_processor())
+        self.message_log_task = asyncio.create_task(self.message_log_writer())
+        self.heartbeat_flush_task = asyncio.create_task(self.heartbeat_writer())
         # self.retry_task = asyncio.create_task(self.retry_pending_messages())
         self.heartbeat_task = asyncio.create_task(self.heartbeat_monitor())
-        self.keepalive_task = asyncio.create_task(self.keepalive_monitor())
         logger.info(f"OCPP WebSocket server started on {settings.OCPP_WEBSOCKET_HOST}:{settings.OCPP_WEBSOCKET_PORT}")
+        # The loop is chosen by uvicorn (loop="auto" picks uvloop when installed); it is
+        # already running here, so installing a policy at this point would have no effect
+        logger.info(f"OCPP server running on {type(asyncio.get_running_loop()).__module__} event loop")
 
     async def stop(self):
-        for task in [self.message_processor_task, self.retry_task, self.heartbeat_task, self.keepalive_task]:
+        for task in [self.retry_task, self.heartbeat_task, *self.charger_writer_tasks.values()]:
             if task:
                 task.cancel()
+        # The writers flush whatever is still buffered before they exit
+        for task in [self.message_log_task, self.heartbeat_flush_task]:
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
         for ws in list(self.charger_connections.values()) + list(self.master_connections):
             try:
                 await ws.close()
@@ -136,6 +304,7 @@ class OCPPHandler:
         if self.server:
             self.server.close()
             await self.server.wait_closed()
+        self.db_executor.shutdown(wait=True)
         logger.info("OCPP WebSocket server stopped")
 
     async def handle_connection(self, websocket: WebSocketServerProtocol, path: str):
@@ -160,41 +329,38 @@ class OCPPHandler:
             return
 
         self.charger_connections[charger_id] = websocket
-        self.connection_ids[charger_id] = str(uuid.uuid4())
+        set_tcp_keepalive(websocket)
+        self.connection_ids[charger_id] = new_connection_id()
+        send_queue = asyncio.Queue(maxsize=CHARGER_SEND_QUEUE_SIZE)
+        self.charger_send_queues[charger_id] = send_queue
+        self.charger_writer_tasks[charger_id] = asyncio.create_task(self.charger_writer(charger_id, websocket, send_queue))
         self.stats["connections_total"] += 1
         self.stats["connections_active"] += 1
 
-        db = SessionLocal()
         try:
-            charger = db.query(Charger).filter(Charger.id == charger_id).first()
-            if not charger:
-                charger = Charger(id=charger_id, status="Unknown", is_connected=True, last_heartbeat=get_egypt_now())
-                db.add(charger)
-            else:
-                charger.is_connected = True
-                charger.last_heartbeat = get_egypt_now()
-            db.add(ConnectionEvent(charger_id=charger_id, event_type="CONNECT", timestamp=get_egypt_now()))
-            db.commit()
-        finally:
-            db.close()
+            # The CONNECT event is committed before any frame is handled, so commands can be accepted right away;
+            # if it fails, the finally below still releases the id so the charger can reconnect
+            await self.run_db(self.record_charger_connected, charger_id)
+            self.connection_events_cache.clear()
 
-        try:
             async for message in websocket:
-                start_time = time()
+                start_time = perf_counter()
                 try:
-                    ocpp_message = json.loads(message)
-                    logger.info(f"Received message from charger {charger_id}: {message}")
-                    await self.forward_to_masters(charger_id, self.connection_ids[charger_id], ocpp_message, "incoming", time() - start_time)
+                    # orjson parses str and bytes frames alike, so binary frames skip a decode
+                    ocpp_message = orjson.loads(message)
+                    # Every frame is already stored in MessageLog; only echo it when debugging
+                    logger.debug("Received message from charger %s: %s", charger_id, message)
+                    await self.forward_to_masters(charger_id, self.connection_ids[charger_id], ocpp_message, "incoming", perf_counter() - start_time)
                     await self.handle_charger_message(charger_id, ocpp_message)
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     error_msg = {
                         "message_type": "error",
                         "timestamp": get_egypt_now().isoformat(),
                         "charger_id": charger_id,
                         "error": "Invalid JSON format",
-                        "raw_message": str(message)
+                        "raw_message": message.decode(errors="replace") if isinstance(message, bytes) else message
                     }
-                    await self.forward_to_masters(charger_id, self.connection_ids[charger_id], error_msg, "incoming", time() - start_time)
+                    await self.forward_to_masters(charger_id, self.connection_ids[charger_id], error_msg, "incoming", perf_counter() - start_time)
                     logger.error(f"Invalid JSON from {charger_id}: {message}")
         except websockets.exceptions.ConnectionClosed:
             error_msg = {
@@ -206,35 +372,115 @@ class OCPPHandler:
             }
             await self.forward_to_masters(charger_id, self.connection_ids[charger_id], error_msg, "incoming", 0.0)
         finally:
-            self.charger_connections.pop(charger_id, None)
-            self.connection_ids.pop(charger_id, None)
-            self.stats["connections_active"] -= 1
-            db = SessionLocal()
+            # Write before releasing the id, so a reconnect's connected flag always lands after this one
             try:
-                charger = db.query(Charger).filter(Charger.id == charger_id).first()
-                if charger:
-                    charger.is_connected = False
-                db.add(ConnectionEvent(charger_id=charger_id, event_type="DISCONNECT", timestamp=get_egypt_now()))
-                db.commit()
+                await self.run_db(self.record_chargers_disconnected, [charger_id])
             finally:
-                db.close()
+                self.connection_events_cache.clear()
+                self.remove_charger_connection(charger_id)
+
+    def remove_charger_connection(self, charger_id: str) -> bool:
+        """Drop a charger's connection state and stop its writer; False if it was already removed"""
+        websocket = self.charger_connections.pop(charger_id, None)
+        self.connection_ids.pop(charger_id, None)
+        self.charger_send_queues.pop(charger_id, None)
+        self.connector_states.pop(charger_id, None)
+        # CALLs to a closed connection will never be answered
+        self.stats["pending_messages"] -= len(self.pending_by_charger.pop(charger_id, {}))
+        writer = self.charger_writer_tasks.pop(charger_id, None)
+        if writer:
+            writer.cancel()
+        
+        if websocket is None:
+            return False
+        self.stats["connections_active"] -= 1
+        return True
+
+    async def charger_writer(self, charger_id: str, websocket: WebSocketServerProtocol, send_queue: asyncio.Queue):
+        """Send queued frames to one charger, so a slow peer never blocks message handling"""
+        while True:
+            try:
+                batch = [await send_queue.get()]
+                while len(batch) < CHARGER_WRITE_BATCH_MAX:
+                    try:
+                        batch.append(send_queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+                
+                # OCPP-J needs one frame per message; send everything ready in this wakeup back to back
+                start_time = perf_counter()
+                cork = settings.OCPP_BATCH_WRITES and len(batch) > 1
+                if cork:
+                    set_tcp_cork(websocket, True)
+                try:
+                    for message, message_json, processing_time in batch:
+                        await websocket.send(message_json)
+                        self.stats["messages_sent"] += 1
+                finally:
+                    if cork:
+                        set_tcp_cork(websocket, False)
+                
+                # Forward after uncorking so master fan-out doesn't hold the batch back
+                for message, message_json, processing_time in batch:
+                    await self.forward_to_masters(charger_id, self.connection_ids.get(charger_id) or new_connection_id(), message, "outgoing", processing_time or (perf_counter() - start_time))
+            except asyncio.CancelledError:
+                break
+            except websockets.exceptions.ConnectionClosed:
+                break
+            except Exception as e:
+                logger.error(f"Error sending message to {charger_id}: {e}")
+                self.stats["messages_failed"] += 1
+
+    def enqueue_for_charger(self, charger_id: str, message: List[Any], message_json: str, processing_time: float = 0.0) -> bool:
+        """Hand a serialized frame to the charger's writer; False if it is disconnected or backed up"""
+        send_queue = self.charger_send_queues.get(charger_id)
+        if send_queue is None:
+            logger.error(f"No WebSocket connection found for charger {charger_id}")
+            self.stats["messages_failed"] += 1
+            return False
+        
+        try:
+            send_queue.put_nowait((message, message_json, processing_time))
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Send queue full for charger {charger_id}, dropping message")
+            self.stats["messages_failed"] += 1
+            return False
 
     async def handle_master_connection(self, websocket: WebSocketServerProtocol):
         self.master_connections.add(websocket)
+        send_queue = asyncio.Queue(maxsize=MASTER_SEND_QUEUE_SIZE)
+        self.master_send_queues[websocket] = send_queue
+        writer = asyncio.create_task(self.master_writer(websocket, send_queue))
         self.stats["master_connections"] += 1
         try:
             await websocket.wait_closed()
         finally:
             self.master_connections.discard(websocket)
+            self.master_send_queues.pop(websocket, None)
+            writer.cancel()
             self.stats["master_connections"] -= 1
 
+    async def master_writer(self, websocket: WebSocketServerProtocol, send_queue: asyncio.Queue):
+        """Send forwarded frames to one master, so a slow master never stalls charger handling"""
+        while True:
+            forwarded_json = await send_queue.get()
+            try:
+                await websocket.send(forwarded_json)
+                self.stats["messages_forwarded"] += 1
+            except websockets.exceptions.ConnectionClosed:
+                return
+            except Exception as e:
+                logger.error(f"Error forwarding message to master: {e}")
+
     async def forward_to_masters(self, charger_id: str, connection_id: str, ocpp_message: Any, direction: str, processing_time: float):
-        if not self.master_connections:
+        if not self.master_send_queues:
             return
 
+        now = get_egypt_now()
         forwarded_message = {
             "message_type": "ocpp_forward",
-            "timestamp": get_egypt_now().isoformat(),
+            "timestamp": now.isoformat(),
             "charger_id": charger_id,
             "connection_id": connection_id,
             "direction": direction,
@@ -243,32 +489,38 @@ class OCPPHandler:
             "source": "ocpp_handler"
         }
 
-        db = SessionLocal()
-        try:
-            db.add(MessageLog(
-                timestamp=get_egypt_now(),
-                charger_id=charger_id,
-                message_type="FORWARD",
-                action="ForwardToMaster",
-                message_id=ocpp_message[1] if isinstance(ocpp_message, list) and len(ocpp_message) > 1 else str(uuid.uuid4()),
-                status="Success",
-                request=json.dumps(forwarded_message)
-            ))
-            db.commit()
-        finally:
-            db.close()
-
-        disconnected_masters = set()
-        for master_ws in self.master_connections:
+        forwarded_json = dumps_text(forwarded_message)
+        self.queue_message_log({
+            "timestamp": now,
+            "charger_id": charger_id,
+            "message_type": "FORWARD",
+            "action": "ForwardToMaster",
+            "message_id": ocpp_message[1] if isinstance(ocpp_message, list) and len(ocpp_message) > 1 else new_message_id(),
+            "status": "Success",
+            "request": forwarded_json
+        })
+
+        # Hand the one serialized payload to every master's writer; nothing here waits on a socket
+        for send_queue in self.master_send_queues.values():
             try:
-                await master_ws.send(json.dumps(forwarded_message))
-                self.stats["messages_forwarded"] += 1
-            except websockets.exceptions.ConnectionClosed:
-                disconnected_masters.add(master_ws)
-            except Exception as e:
-                logger.error(f"Error forwarding message to master: {e}")
-
-        self.master_connections -= disconnected_masters
+                send_queue.put_nowait(forwarded_json)
+            except asyncio.QueueFull:
+                self.stats["master_messages_dropped"] += 1
+
+    def add_pending_message(self, pending: PendingMessage):
+        """Track a CALL sent to a charger until it is answered"""
+        charger_pending = self.pending_by_charger.setdefault(pending.charger_id, {})
+        if pending.message_id not in charger_pending:
+            self.stats["pending_messages"] += 1
+        charger_pending[pending.message_id] = pending
+
+    def pop_pending_message(self, charger_id: str, message_id: str) -> Optional[PendingMessage]:
+        """Remove and return the pending CALL a charger is answering, if any"""
+        charger_pending = self.pending_by_charger.get(charger_id)
+        pending = charger_pending.pop(message_id, None) if charger_pending else None
+        if pending:
+            self.stats["pending_messages"] -= 1
+        return pending
 
     async def handle_call_result(self, charger_id: str, message_id: str, payload: Dict[str, Any]):
         """
@@ -276,45 +528,21 @@ class OCPPHandler:
         Mark the pending message as responded and route to specific handler if available.
         """
         action_name = "Unknown"
-        if message_id in self.pending_messages:
-            pending = self.pending_messages[message_id]
+        pending = self.pop_pending_message(charger_id, message_id)
+        if pending:
             action_name = pending.action
-            self.pending_messages[message_id].response_received = True
-            self.pending_messages.pop(message_id, None)
-            self.stats["pending_messages"] -= 1
+            pending.response_received = True
             logger.info(f"Received CALLRESULT for {action_name} (message_id={message_id}) from charger {charger_id}: {payload}")
         
             # Route to specific handler based on action type
             await self.handle_specific_call_result(charger_id, action_name, message_id, payload)
         else:
             logger.info(f"Received CALLRESULT for message {message_id} from charger {charger_id} (not in pending list): {payload}")
-        db = SessionLocal()
-        try:
-            await self.log_message(charger_id, "IN", "CallResult", message_id, "Success", None, None, json.dumps(payload))
-        finally:
-            db.close()
+        await self.log_message(charger_id, "IN", "CallResult", message_id, "Success", None, None, dumps_text(payload))
     
     async def handle_specific_call_result(self, charger_id: str, action: str, message_id: str, payload: Dict[str, Any]):
         """Route CALLRESULT to specific handler based on action type"""
-        handler_map = {
-            "ChangeAvailability": self.on_change_availability_response,
-            "ChangeConfiguration": self.on_change_configuration_response,
-            "ClearCache": self.on_clear_cache_response,
-            "ClearChargingProfile": self.on_clear_charging_profile_response,
-            "GetConfiguration": self.on_get_configuration_response,
-            "GetDiagnostics": self.on_get_diagnostics_response,
-            "GetLocalListVersion": self.on_get_local_list_version_response,
-            "RemoteStartTransaction": self.on_remote_start_transaction_response,
-            "RemoteStopTransaction": self.on_remote_stop_transaction_response,
-            "Reset": self.on_reset_response,
-            "SendLocalList": self.on_send_local_list_response,
-            "SetChargingProfile": self.on_set_charging_profile_response,
-            "TriggerMessage": self.on_trigger_message_response,
-            "UnlockConnector": self.on_unlock_connector_response,
-            "UpdateFirmware": self.on_update_firmware_response,
-        }
-        
-        handler = handler_map.get(action)
+        handler = self._result_handlers.get(action)
         if handler:
             await handler(charger_id, message_id, payload)
 
@@ -324,34 +552,33 @@ class OCPPHandler:
         Mark the pending message as responded.
         """
         action_name = "Unknown"
-        if message_id in self.pending_messages:
-            pending = self.pending_messages[message_id]
+        pending = self.pop_pending_message(charger_id, message_id)
+        if pending:
             action_name = pending.action
-            self.pending_messages[message_id].response_received = True
-            self.pending_messages.pop(message_id, None)
-            self.stats["pending_messages"] -= 1
+            pending.response_received = True
             logger.warning(f"Received CALLERROR for {action_name} (message_id={message_id}) from charger {charger_id}: {error_code} - {error_description}")
         else:
             logger.warning(f"Received CALLERROR for message {message_id} from charger {charger_id} (not in pending list): {error_code} - {error_description}")
         
-        db = SessionLocal()
-        try:
-            error_data = {"errorCode": error_code, "errorDescription": error_description, "errorDetails": error_details}
-            await self.log_message(charger_id, "IN", "CallError", message_id, "Error", None, None, json.dumps(error_data))
-        finally:
-            db.close()
+        error_data = {"errorCode": error_code, "errorDescription": error_description, "errorDetails": error_details}
+        await self.log_message(charger_id, "IN", "CallError", message_id, "Error", None, None, dumps_text(error_data))
 
     async def handle_charger_message(self, charger_id: str, message: List[Any]):
         self.stats["messages_received"] += 1
-        start_time = time()
+        start_time = perf_counter()
         message_type = message[0]
 
         try:
             if message_type == 2:
                 message_id, action, payload = message[1:4]
                 response = await self.handle_incoming_call(charger_id, message_id, action, payload)
+                # Serialize the reply once for both the charger and the message log
+                response_json = dumps_response(action, response) if response else None
+                processing_time = perf_counter() - start_time
                 if response:
-                    await self.send_message_to_charger(charger_id, response, processing_time=time() - start_time)
+                    await self.send_message_to_charger(charger_id, response, processing_time=processing_time, message_json=response_json)
+                await self.log_message(charger_id, "IN", action, message_id, "Success" if response and response[0] != 4 else "Error",
+                                      processing_time, dumps_text(payload), response_json)
             elif message_type == 3:
                 message_id, payload = message[1:3]
                 logger.info(f"Received CALLRESULT from charger {charger_id}: message_id={message_id}, payload={payload}")
@@ -366,13 +593,13 @@ class OCPPHandler:
             logger.error(f"Error processing message from {charger_id}: {e}\n{error_traceback}")
             self.stats["messages_failed"] += 1
             # Get message_id safely
-            message_id = message[1] if len(message) > 1 else str(uuid.uuid4())
+            message_id = message[1] if len(message) > 1 else new_message_id()
             # Provide a cleaner error message for FormatViolation
             error_message = str(e)
             if "invalid literal for int()" in error_message:
                 error_message = "Invalid transaction ID format in database. Please check for non-integer transaction IDs."
             error_response = [4, message_id, "FormatViolation", error_message, {}]
-            await self.send_message_to_charger(charger_id, error_response, processing_time=time() - start_time)
+            await self.send_message_to_charger(charger_id, error_response, processing_time=perf_counter() - start_time)
 
     async def handle_incoming_call(self, charger_id: str, message_id: str, action: str, payload: Dict[str, Any]) -> Optional[List[Any]]:
         """
@@ -403,155 +630,234 @@ class OCPPHandler:
         - Reset, SendLocalList, SetChargingProfile, TriggerMessage
         - UnlockConnector, UpdateFirmware
         """
+        response = None
+        handler = self._incoming_handlers.get(action)
+        if handler:
+            response = await handler(charger_id, message_id, payload)
+        else:
+            response = [4, message_id, "NotImplemented", f"Action {action} not supported", {}]
+            self.stats["messages_failed"] += 1
+
+        if self.session_manager and response:
+            # Extract payload dict from response [3, message_id, payload_dict]
+            response_payload = response[2] if len(response) > 2 and isinstance(response, list) else response
+            await self.session_manager.handle_ocpp_message(charger_id, action, payload, response_payload)
+        return response
+
+    async def handle_boot_notification(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+        await self.run_db(self.record_boot_notification, charger_id, payload)
+        
+        # Create proper BootNotificationPayload using OCPP library
+        boot_response = call_result.BootNotificationPayload(
+            current_time=get_egypt_now().isoformat(),
+            interval=60,
+            status=RegistrationStatus.accepted
+        )
+        
+        # Convert dataclass to dict with camelCase keys for JSON serialization
+        boot_response_dict = asdict_camelcase(boot_response)
+        
+        # Return in OCPP message format [3, message_id, payload_dict]
+        return [3, message_id, boot_response_dict]
+
+    def record_boot_notification(self, charger_id: str, payload: Dict[str, Any]):
+        """Write only the identity columns a BootNotification reports, in one UPDATE"""
         db = SessionLocal()
         try:
-            start_time = time()
-            response = None
-            if action == "Authorize":
-                response = await self.handle_authorize(charger_id, message_id, payload)
-            elif action == "BootNotification":
-                response = await self.handle_boot_notification(charger_id, message_id, payload)
-            elif action == "CancelReservation":
-                response = await self.handle_cancel_reservation(charger_id, message_id, payload)
-            elif action == "DataTransfer":
-                response = await self.handle_data_transfer(charger_id, message_id, payload)
-            elif action == "DiagnosticsStatusNotification":
-                response = await self.handle_diagnostics_status_notification(charger_id, message_id, payload)
-            elif action == "FirmwareStatusNotification":
-                response = await self.handle_firmware_status_notification(charger_id, message_id, payload)
-            elif action == "GetCompositeSchedule":
-                response = await self.handle_get_composite_schedule(charger_id, message_id, payload)
-            elif action == "Heartbeat":
-                response = await self.handle_heartbeat(charger_id, message_id, payload)
-            elif action == "RemoteStartTransaction":
-                response = await self.handle_remote_start_transaction(charger_id, message_id, payload)
-            elif action == "RemoteStopTransaction":
-                response = await self.handle_remote_stop_transaction(charger_id, message_id, payload)
-            elif action == "ReserveNow":
-                response = await self.handle_reserve_now(charger_id, message_id, payload)
-            elif action == "MeterValues":
-                response = await self.handle_meter_values(charger_id, message_id, payload)
-            elif action == "StartTransaction":
-                response = await self.handle_start_transaction(charger_id, message_id, payload)
-            elif action == "StatusNotification":
-                response = await self.handle_status_notification(charger_id, message_id, payload)
-            elif action == "StopTransaction":
-                response = await self.handle_stop_transaction(charger_id, message_id, payload)
-            elif action == "TriggerMessage":
-                response = await self.handle_trigger_message(charger_id, message_id, payload)
-            else:
-                response = [4, message_id, "NotImplemented", f"Action {action} not supported", {}]
-                self.stats["messages_failed"] += 1
+            db.query(Charger).filter(Charger.id == charger_id).update({
+                Charger.vendor: payload.get("chargePointVendor"),
+                Charger.model: payload.get("chargePointModel"),
+                Charger.serial_number: payload.get("chargePointSerialNumber"),
+                Charger.firmware_version: payload.get("firmwareVersion")
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
 
-            if self.session_manager and response:
-                # Extract payload dict from response [3, message_id, payload_dict]
-                response_payload = response[2] if len(response) > 2 and isinstance(response, list) else response
-                await self.session_manager.handle_ocpp_message(charger_id, action, payload, response_payload)
-            await self.log_message(charger_id, "IN", action, message_id, "Success" if response and response[0] != 4 else "Error",
-                                  time() - start_time, json.dumps(payload), json.dumps(response) if response else None)
-            return response
+    async def handle_heartbeat(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+        now = get_egypt_now()
+        # Written behind by heartbeat_writer; the reply doesn't wait on the DB
+        self.heartbeat_buffer[charger_id] = now
+        # Same shape as call_result.HeartbeatPayload, built directly on this hot path
+        return [3, message_id, {"currentTime": now.isoformat()}]
+
+    def write_heartbeats(self, heartbeats: Dict[str, datetime]):
+        """Store buffered Heartbeat times with one executemany UPDATE"""
+        # A Core UPDATE has no matched-rowcount check, so a charger whose row was deleted
+        # since its last Heartbeat is skipped instead of failing the whole batch
+        chargers = Charger.__table__
+        stmt = update(chargers).where(chargers.c.id == bindparam("b_id")).values(last_heartbeat=bindparam("ts"))
+        db = SessionLocal()
+        try:
+            db.execute(stmt, [{"b_id": charger_id, "ts": timestamp} for charger_id, timestamp in heartbeats.items()])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
         finally:
             db.close()
 
-    async def handle_boot_notification(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+    async def heartbeat_writer(self):
+        """Flush buffered Heartbeat timestamps as one batched UPDATE per interval"""
+        try:
+            while True:
+                await asyncio.sleep(HEARTBEAT_FLUSH_INTERVAL)
+                if not self.heartbeat_buffer:
+                    continue
+                heartbeats, self.heartbeat_buffer = self.heartbeat_buffer, {}
+                try:
+                    await self.run_db(self.write_heartbeats, heartbeats)
+                except (OperationalError, InterfaceError) as e:
+                    logger.error(f"Failed to write {len(heartbeats)} heartbeats, retrying: {e}")
+                    # Connection trouble passes; retry next interval unless a newer heartbeat has arrived meanwhile
+                    for charger_id, timestamp in heartbeats.items():
+                        self.heartbeat_buffer.setdefault(charger_id, timestamp)
+                except Exception as e:
+                    # Anything else would fail the same way every interval, so the batch is dropped
+                    logger.error(f"Dropped {len(heartbeats)} heartbeats that failed to write: {e}")
+        except asyncio.CancelledError:
+            if self.heartbeat_buffer:
+                heartbeats, self.heartbeat_buffer = self.heartbeat_buffer, {}
+                try:
+                    self.write_heartbeats(heartbeats)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(heartbeats)} heartbeats on shutdown: {e}")
+            raise
+
+    async def handle_status_notification(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+        connector_id = payload.get("connectorId", 0)
+        status = payload.get("status")
+        error_code = payload.get("errorCode")
+        state = (status, error_code)
+        charger_states = self.connector_states.setdefault(charger_id, {})
+        # Chargers often re-send an unchanged status; only a change needs writing
+        if charger_states.get(connector_id) != state:
+            await self.run_db(self.record_connector_status, charger_id, connector_id, status, error_code)
+            charger_states[connector_id] = state
+        logger.info(f"StatusNotification processed for charger {charger_id}, connector {connector_id}: status={status}, error_code={error_code}")
+        
+        # Create proper StatusNotificationPayload using OCPP library (empty dict)
+        status_response = call_result.StatusNotificationPayload()
+        status_dict = asdict_camelcase(status_response)
+        
+        return [3, message_id, status_dict]
+
+    def record_charger_connected(self, charger_id: str):
+        """Mark a charger connected (one UPDATE when it is known, insert it otherwise) and log CONNECT"""
+        now = get_egypt_now()
         db = SessionLocal()
         try:
-            charger = db.query(Charger).filter(Charger.id == charger_id).first()
-            if charger:
-                charger.vendor = payload.get("chargePointVendor")
-                charger.model = payload.get("chargePointModel")
-                charger.serial_number = payload.get("chargePointSerialNumber")
-                charger.firmware_version = payload.get("firmwareVersion")
-                db.commit()
-            
-            # Create proper BootNotificationPayload using OCPP library
-            boot_response = call_result.BootNotificationPayload(
-                current_time=get_egypt_now().isoformat(),
-                interval=60,
-                status=RegistrationStatus.accepted
-            )
-            
-            # Convert dataclass to dict with camelCase keys for JSON serialization
-            boot_response_dict = asdict_camelcase(boot_response)
-            
-            # Return in OCPP message format [3, message_id, payload_dict]
-            return [3, message_id, boot_response_dict]
+            updated = db.query(Charger).filter(Charger.id == charger_id).update({
+                Charger.is_connected: True,
+                Charger.last_heartbeat: now
+            }, synchronize_session=False)
+            if not updated:
+                db.add(Charger(id=charger_id, status="Unknown", is_connected=True, last_heartbeat=now))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Inserted by a concurrent reconnect of the same charger; it is connected either way
+                    db.rollback()
+            db.add(ConnectionEvent(charger_id=charger_id, event_type="CONNECT", timestamp=now))
+            db.commit()
         finally:
             db.close()
 
-    async def handle_heartbeat(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+    def forget_connector_states(self, charger_id: str):
+        """Drop remembered connector statuses after they were changed outside StatusNotification"""
+        self.connector_states.pop(charger_id, None)
+
+    def record_chargers_disconnected(self, charger_ids: List[str]):
+        """Clear is_connected and log DISCONNECT for each charger in the same commit"""
+        now = get_egypt_now()
         db = SessionLocal()
         try:
-            charger = db.query(Charger).filter(Charger.id == charger_id).first()
-            if charger:
-                charger.last_heartbeat = get_egypt_now()
-                db.commit()
-            
-            # Create proper HeartbeatPayload using OCPP library
-            heartbeat_response = call_result.HeartbeatPayload(
-                current_time=get_egypt_now().isoformat()
+            db.query(Charger).filter(Charger.id.in_(charger_ids)).update(
+                {Charger.is_connected: False}, synchronize_session=False
             )
-            heartbeat_dict = asdict_camelcase(heartbeat_response)
-            
-            return [3, message_id, heartbeat_dict]
+            db.add_all([ConnectionEvent(charger_id=charger_id, event_type="DISCONNECT", timestamp=now) for charger_id in charger_ids])
+            db.commit()
         finally:
             db.close()
 
-    async def handle_status_notification(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+    def record_connector_status(self, charger_id: str, connector_id: int, status: Optional[str], error_code: Optional[str]):
+        """Store a connector's status: one UPDATE when the connector is known, insert it otherwise"""
         db = SessionLocal()
         try:
-            connector_id = payload.get("connectorId", 0)
-            status = payload.get("status")
-            error_code = payload.get("errorCode")
-            
-            # Ensure charger exists in database
-            charger = db.query(Charger).filter(Charger.id == charger_id).first()
-            if not charger:
-                charger = Charger(id=charger_id, status="Unknown", is_connected=True, last_heartbeat=get_egypt_now())
-                db.add(charger)
-                db.flush()  # Flush to get the charger ID for foreign key
-            
-            # Query for existing connector
-            connector = db.query(Connector).filter(
-                Connector.charger_id == charger_id, 
+            updated = db.query(Connector).filter(
+                Connector.charger_id == charger_id,
                 Connector.connector_id == connector_id
-            ).first()
+            ).update({
+                Connector.status: status,
+                Connector.error_code: error_code,
+                Connector.updated_at: get_egypt_now()
+            }, synchronize_session=False)
             
-            if connector:
-                # Update existing connector
-                connector.status = status
-                connector.error_code = error_code
-                connector.updated_at = get_egypt_now()
-            else:
-                # Create new connector
-                connector = Connector(
+            if not updated:
+                # Ensure charger exists in database
+                if db.get(Charger, charger_id) is None:
+                    db.add(Charger(id=charger_id, status="Unknown", is_connected=True, last_heartbeat=get_egypt_now()))
+                    db.flush()  # Flush to get the charger ID for foreign key
+                db.add(Connector(
                     charger_id=charger_id,
                     connector_id=connector_id,
                     status=status,
                     error_code=error_code
-                )
-                db.add(connector)
+                ))
             
             db.commit()
-            logger.info(f"StatusNotification processed for charger {charger_id}, connector {connector_id}: status={status}, error_code={error_code}")
-            
-            # Create proper StatusNotificationPayload using OCPP library (empty dict)
-            status_response = call_result.StatusNotificationPayload()
-            status_dict = asdict_camelcase(status_response)
-            
-            return [3, message_id, status_dict]
         finally:
             db.close()
 
     async def handle_meter_values(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+        connector_id = payload.get("connectorId", 0)
+        transaction_id = payload.get("transactionId")
+        # Ensure transaction_id is an integer
+        if transaction_id is not None:
+            transaction_id = int(transaction_id)
+        
+        # Only energy register samples touch the DB; skip the session entirely when there are none
+        energy_values_wh = [
+            # Handle string values from charger (convert to float)
+            float(sample.get("value", 0)) if sample.get("value", 0) is not None else 0.0
+            for meter_value in payload.get("meterValue", [])
+            for sample in meter_value.get("sampledValue", [])
+            if sample.get("measurand") == "Energy.Active.Import.Register"
+        ]
+        
+        if energy_values_wh:
+            wattage_exhausted = await self.run_db(self.record_meter_values, charger_id, connector_id, transaction_id, energy_values_wh)
+            # The card's wattage limit ran out, so automatically stop the transaction
+            if wattage_exhausted:
+                # Send RemoteStopTransaction to charger
+                stop_message_id = str(uuid.uuid4())
+                stop_message = [
+                    2,  # CALL
+                    stop_message_id,
+                    "RemoteStopTransaction",
+                    {
+                        "transactionId": transaction_id
+                    }
+                ]
+                
+                # Send the stop command
+                success = await self.send_message_to_charger(charger_id, stop_message)
+                if success:
+                    logger.info(f"Successfully sent RemoteStopTransaction for transaction {transaction_id} due to wattage limit")
+                else:
+                    logger.error(f"Failed to send RemoteStopTransaction for transaction {transaction_id}")
+        
+        # Create proper MeterValuesPayload using OCPP library (empty dict)
+        meter_response = call_result.MeterValuesPayload()
+        meter_dict = asdict_camelcase(meter_response)
+        
+        return [3, message_id, meter_dict]
+
+    def record_meter_values(self, charger_id: str, connector_id: int, transaction_id: Optional[int], energy_values_wh: List[float]) -> bool:
+        """Apply energy readings to the connector, the active session and its RFID card; True once the card's wattage is used up"""
+        wattage_exhausted = False
         db = SessionLocal()
         try:
-            connector_id = payload.get("connectorId", 0)
-            transaction_id = payload.get("transactionId")
-            # Ensure transaction_id is an integer
-            if transaction_id is not None:
-                transaction_id = int(transaction_id)
-            
             # Get the active session to find the id_tag
             session = None
             if transaction_id:
@@ -565,184 +871,171 @@ class OCPPHandler:
             energy_consumed_wh = 0.0
             previous_energy_wh = 0.0
             
-            for meter_value in payload.get("meterValue", []):
-                for sample in meter_value.get("sampledValue", []):
-                    if sample.get("measurand") == "Energy.Active.Import.Register":
-                        # Handle string values from charger (convert to float)
-                        value = sample.get("value", 0)
-                        if isinstance(value, str):
-                            energy_value_wh = float(value)
-                        else:
-                            energy_value_wh = float(value) if value is not None else 0.0
-                        
-                        # Update connector energy delivered (convert to kWh)
-                        connector = db.query(Connector).filter(
-                            Connector.charger_id == charger_id,
-                            Connector.connector_id == connector_id
-                        ).first()
-                        if connector:
-                            connector.energy_delivered = energy_value_wh / 1000  # Convert Wh to kWh
-                            connector.last_updated = get_egypt_now()
-                        
-                        # Store meter_start if not set (fallback if StartTransaction didn't provide it)
-                        if session and session.meter_start is None:
-                            session.meter_start = energy_value_wh
-                            db.commit()
-                            logger.info(f"Set meter_start from first MeterValues: {energy_value_wh} Wh for transaction {transaction_id}")
+            # Connector to keep energy_delivered current on (convert to kWh)
+            connector = db.query(Connector).filter(
+                Connector.charger_id == charger_id,
+                Connector.connector_id == connector_id
+            ).first()
+            
+            for energy_value_wh in energy_values_wh:
+                if connector:
+                    connector.energy_delivered = energy_value_wh / 1000  # Convert Wh to kWh
+                    connector.last_updated = get_egypt_now()
+                
+                # Store meter_start if not set (fallback if StartTransaction didn't provide it)
+                if session and session.meter_start is None:
+                    session.meter_start = energy_value_wh
+                    db.commit()
+                    logger.info(f"Set meter_start from first MeterValues: {energy_value_wh} Wh for transaction {transaction_id}")
+                
+                # Update session energy_delivered based on difference from last meter reading
+                if session:
+                    # Initialize session_metadata if not exists
+                    if not session.session_metadata:
+                        session.session_metadata = {}
+                    
+                    # Get last energy meter reading from session metadata
+                    last_energy_wh = session.session_metadata.get("last_energy_wh")
+                    
+                    if last_energy_wh is not None:
+                        # Calculate difference: current - last
+                        energy_difference_wh = energy_value_wh - last_energy_wh
                         
-                        # Update session energy_delivered based on difference from last meter reading
-                        if session:
-                            # Initialize session_metadata if not exists
-                            if not session.session_metadata:
-                                session.session_metadata = {}
+                        # Only update if difference is positive (energy increased)
+                        if energy_difference_wh > 0:
+                            # Convert Wh to kWh and add to existing energy_delivered
+                            energy_difference_kwh = energy_difference_wh / 1000.0
+                            session.energy_delivered = (session.energy_delivered or 0.0) + energy_difference_kwh
+                            logger.info(f"Updated session energy_delivered: +{energy_difference_kwh:.3f} kWh (total: {session.energy_delivered:.3f} kWh) for transaction {transaction_id}")
+                        elif energy_difference_wh < 0:
+                            logger.warning(f"Negative energy difference detected for transaction {transaction_id}: {energy_difference_wh} Wh. Meter reading decreased, skipping update.")
+                    else:
+                        # First meter reading for this session - initialize but don't add to energy_delivered yet
+                        logger.info(f"First energy meter reading for transaction {transaction_id}: {energy_value_wh} Wh")
+                    
+                    # Store current energy value as last for next meter reading
+                    session.session_metadata["last_energy_wh"] = energy_value_wh
+                    
+                    # Update RFID card remaining_wattage in real-time after each meter value
+                    if session.id_tag and energy_value_wh > 0:
+                        rfid_card = db.query(RFIDCard).filter(RFIDCard.id_tag == session.id_tag).first()
+                        if rfid_card and rfid_card.wattage_limit is not None:
+                            # Ensure meter_start is set (should be from StartTransaction, but fallback to first meter value)
+                            if session.meter_start is None:
+                                session.meter_start = energy_value_wh
+                                logger.warning(f"meter_start was None for transaction {transaction_id}, using first meter value: {energy_value_wh} Wh")
                             
-                            # Get last energy meter reading from session metadata
-                            last_energy_wh = session.session_metadata.get("last_energy_wh")
+                            # Calculate total energy consumed since transaction start (in Wh)
+                            # Energy consumed = current meter reading - meter reading at start
+                            total_consumed_wh = energy_value_wh - session.meter_start
                             
-                            if last_energy_wh is not None:
-                                # Calculate difference: current - last
-                                energy_difference_wh = energy_value_wh - last_energy_wh
-                                
-                                # Only update if difference is positive (energy increased)
-                                if energy_difference_wh > 0:
-                                    # Convert Wh to kWh and add to existing energy_delivered
-                                    energy_difference_kwh = energy_difference_wh / 1000.0
-                                    session.energy_delivered = (session.energy_delivered or 0.0) + energy_difference_kwh
-                                    logger.info(f"Updated session energy_delivered: +{energy_difference_kwh:.3f} kWh (total: {session.energy_delivered:.3f} kWh) for transaction {transaction_id}")
-                                elif energy_difference_wh < 0:
-                                    logger.warning(f"Negative energy difference detected for transaction {transaction_id}: {energy_difference_wh} Wh. Meter reading decreased, skipping update.")
-                            else:
-                                # First meter reading for this session - initialize but don't add to energy_delivered yet
-                                logger.info(f"First energy meter reading for transaction {transaction_id}: {energy_value_wh} Wh")
+                            # Ensure we don't have negative consumption (shouldn't happen, but safety check)
+                            if total_consumed_wh < 0:
+                                logger.warning(f"Negative energy consumption detected for transaction {transaction_id}: {total_consumed_wh} Wh. Setting to 0.")
+                                total_consumed_wh = 0
                             
-                            # Store current energy value as last for next meter reading
-                            session.session_metadata["last_energy_wh"] = energy_value_wh
+                            # Get initial remaining_wattage from session metadata (stored at transaction start)
+                            initial_remaining_wattage = session.session_metadata.get("initial_remaining_wattage")
+                            if initial_remaining_wattage is None:
+                                # Fallback: use current remaining_wattage or wattage_limit
+                                initial_remaining_wattage = rfid_card.remaining_wattage if rfid_card.remaining_wattage is not None else rfid_card.wattage_limit
+                                session.session_metadata["initial_remaining_wattage"] = initial_remaining_wattage
                             
-                            # Update RFID card remaining_wattage in real-time after each meter value
-                            if session.id_tag and energy_value_wh > 0:
-                                rfid_card = db.query(RFIDCard).filter(RFIDCard.id_tag == session.id_tag).first()
-                                if rfid_card and rfid_card.wattage_limit is not None:
-                                    # Ensure meter_start is set (should be from StartTransaction, but fallback to first meter value)
-                                    if session.meter_start is None:
-                                        session.meter_start = energy_value_wh
-                                        logger.warning(f"meter_start was None for transaction {transaction_id}, using first meter value: {energy_value_wh} Wh")
-                                    
-                                    # Calculate total energy consumed since transaction start (in Wh)
-                                    # Energy consumed = current meter reading - meter reading at start
-                                    total_consumed_wh = energy_value_wh - session.meter_start
-                                    
-                                    # Ensure we don't have negative consumption (shouldn't happen, but safety check)
-                                    if total_consumed_wh < 0:
-                                        logger.warning(f"Negative energy consumption detected for transaction {transaction_id}: {total_consumed_wh} Wh. Setting to 0.")
-                                        total_consumed_wh = 0
-                                    
-                                    # Get initial remaining_wattage from session metadata (stored at transaction start)
-                                    initial_remaining_wattage = session.session_metadata.get("initial_remaining_wattage")
-                                    if initial_remaining_wattage is None:
-                                        # Fallback: use current remaining_wattage or wattage_limit
-                                        initial_remaining_wattage = rfid_card.remaining_wattage if rfid_card.remaining_wattage is not None else rfid_card.wattage_limit
-                                        session.session_metadata["initial_remaining_wattage"] = initial_remaining_wattage
-                                    
-                                    # Calculate new remaining wattage
-                                    new_remaining_wattage = initial_remaining_wattage - total_consumed_wh
-                                    if new_remaining_wattage < 0:
-                                        new_remaining_wattage = 0
-                                    
-                                    # Update RFID card remaining_wattage in real-time
-                                    rfid_card.remaining_wattage = new_remaining_wattage
-                                    
-                                    logger.info(f"Updated remaining_wattage for RFID card {session.id_tag}: {rfid_card.remaining_wattage:.2f} Wh remaining (consumed {total_consumed_wh:.2f} Wh from initial {initial_remaining_wattage:.2f} Wh)")
-                                    
-                                    # If remaining_wattage reached zero or below, automatically stop the transaction
-                                    if rfid_card.remaining_wattage <= 0:
-                                        logger.warning(f"RFID card {session.id_tag} wattage limit reached (remaining: {rfid_card.remaining_wattage:.2f} Wh). Automatically stopping transaction {transaction_id}")
-                                        
-                                        # Send RemoteStopTransaction to charger
-                                        stop_message_id = str(uuid.uuid4())
-                                        stop_message = [
-                                            2,  # CALL
-                                            stop_message_id,
-                                            "RemoteStopTransaction",
-                                            {
-                                                "transactionId": transaction_id
-                                            }
-                                        ]
-                                        
-                                        # Send the stop command
-                                        success = await self.send_message_to_charger(charger_id, stop_message)
-                                        if success:
-                                            logger.info(f"Successfully sent RemoteStopTransaction for transaction {transaction_id} due to wattage limit")
-                                        else:
-                                            logger.error(f"Failed to send RemoteStopTransaction for transaction {transaction_id}")
-                        
-                        previous_energy_wh = energy_value_wh
+                            # Calculate new remaining wattage
+                            new_remaining_wattage = initial_remaining_wattage - total_consumed_wh
+                            if new_remaining_wattage < 0:
+                                new_remaining_wattage = 0
+                            
+                            # Update RFID card remaining_wattage in real-time
+                            rfid_card.remaining_wattage = new_remaining_wattage
+                            
+                            logger.info(f"Updated remaining_wattage for RFID card {session.id_tag}: {rfid_card.remaining_wattage:.2f} Wh remaining (consumed {total_consumed_wh:.2f} Wh from initial {initial_remaining_wattage:.2f} Wh)")
+                            
+                            # If remaining_wattage reached zero or below, automatically stop the transaction
+                            if rfid_card.remaining_wattage <= 0:
+                                logger.warning(f"RFID card {session.id_tag} wattage limit reached (remaining: {rfid_card.remaining_wattage:.2f} Wh). Automatically stopping transaction {transaction_id}")
+                                
+                                wattage_exhausted = True
+                
+                previous_energy_wh = energy_value_wh
             
             # Commit all updates (session, connector, and RFID card) after processing all meter values
             db.commit()
-            
-            # Create proper MeterValuesPayload using OCPP library (empty dict)
-            meter_response = call_result.MeterValuesPayload()
-            meter_dict = asdict_camelcase(meter_response)
-            
-            return [3, message_id, meter_dict]
+            return wattage_exhausted
         finally:
             db.close()
 
-    async def handle_start_transaction(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+    async def next_transaction_id(self, charger_id: str) -> int:
+        """Next transaction ID for a charger, counted in memory after one DB read per charger
+
+        IDs are unique per charger and persist across CMS restarts because the counter is
+        seeded from the highest stored transaction_id. Incrementing happens on the event loop
+        without an await, so concurrent StartTransactions from one charger can't be handed
+        the same ID. A failed DB read raises without seeding, so the next StartTransaction
+        reads again instead of counting from 0 into IDs that are already stored.
+        """
+        if charger_id not in self.transaction_counters:
+            last_transaction = await self.run_db(self.load_last_transaction_id, charger_id)
+            # A concurrent StartTransaction may have seeded (and advanced) the counter meanwhile
+            self.transaction_counters.setdefault(charger_id, last_transaction)
+        self.transaction_counters[charger_id] += 1
+        return self.transaction_counters[charger_id]
+
+    def load_last_transaction_id(self, charger_id: str) -> int:
         db = SessionLocal()
         try:
-            connector_id = payload.get("connectorId", 0)
-            id_tag = payload.get("idTag")
-            meter_start = payload.get("meterStart", 0)
-            
-            # Convert meter_start to float if it's a string
-            if isinstance(meter_start, str):
-                meter_start = float(meter_start)
-            else:
-                meter_start = float(meter_start) if meter_start is not None else 0.0
-            
-            # Get the last transaction ID for this charger from database
-            # This ensures transaction IDs are unique per charger and persist across CMS restarts
-            # Query for the maximum integer transaction_id (filter out any non-integer values)
             try:
-                # Get all transaction_ids for this charger and find the max integer value
-                all_transactions = db.query(Session.transaction_id).filter(
-                    Session.charger_id == charger_id,
-                    Session.transaction_id.isnot(None)
-                ).all()
-                
-                # Filter and convert to integers, handling any non-integer values
-                integer_transactions = []
-                for (tx_id,) in all_transactions:
-                    try:
-                        if isinstance(tx_id, (int, float)):
-                            integer_transactions.append(int(tx_id))
-                        elif isinstance(tx_id, str):
-                            # Try to convert string to int, skip if it's not a valid integer
-                            try:
-                                integer_transactions.append(int(tx_id))
-                            except (ValueError, TypeError):
-                                logger.warning(f"Skipping non-integer transaction_id for charger {charger_id}: {tx_id}")
-                                continue
-                    except (ValueError, TypeError):
-                        logger.warning(f"Skipping invalid transaction_id for charger {charger_id}: {tx_id}")
-                        continue
-                
-                # Get the maximum integer transaction_id
-                last_transaction = max(integer_transactions) if integer_transactions else None
-                
+                last_transaction = db.query(func.max(Session.transaction_id)).filter(Session.charger_id == charger_id).scalar()
+                return int(last_transaction) if last_transaction is not None else 0
+            except (ValueError, TypeError):
+                # A non-integer transaction_id (possible in SQLite) sorts above the integers;
+                # fall back to scanning for the largest integer value
+                pass
             except Exception as e:
                 logger.error(f"Error querying last transaction_id for charger {charger_id}: {e}")
-                last_transaction = None
-            
-            # If no previous transactions exist, start at 1, otherwise increment
-            if last_transaction is None:
-                transaction_id = 1
-            else:
-                transaction_id = int(last_transaction) + 1
-            
-            logger.info(f"Generated transaction_id={transaction_id} for charger_id={charger_id} (last was {last_transaction})")
-            
+                raise
+
+            integer_transactions = []
+            for (tx_id,) in db.query(Session.transaction_id).filter(Session.charger_id == charger_id, Session.transaction_id.isnot(None)):
+                try:
+                    integer_transactions.append(int(tx_id))
+                except (ValueError, TypeError):
+                    logger.warning(f"Skipping non-integer transaction_id for charger {charger_id}: {tx_id}")
+            return max(integer_transactions, default=0)
+        finally:
+            db.close()
+
+    async def handle_start_transaction(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+        connector_id = payload.get("connectorId", 0)
+        id_tag = payload.get("idTag")
+        meter_start = payload.get("meterStart", 0)
+        
+        # Convert meter_start to float if it's a string
+        if isinstance(meter_start, str):
+            meter_start = float(meter_start)
+        else:
+            meter_start = float(meter_start) if meter_start is not None else 0.0
+        
+        transaction_id = await self.next_transaction_id(charger_id)
+        logger.info(f"Generated transaction_id={transaction_id} for charger_id={charger_id}")
+        
+        await self.run_db(self.record_start_transaction, charger_id, connector_id, transaction_id, id_tag, meter_start)
+        
+        logger.info(f"StartTransaction: charger_id={charger_id}, transaction_id={transaction_id}, id_tag={id_tag}, meter_start={meter_start} Wh")
+        
+        # Create proper StartTransactionPayload using OCPP library
+        start_response = call_result.StartTransactionPayload(
+            transaction_id=transaction_id,
+            id_tag_info={'status': AuthorizationStatus.accepted}
+        )
+        start_dict = asdict_camelcase(start_response)
+        
+        return [3, message_id, start_dict]
+
+    def record_start_transaction(self, charger_id: str, connector_id: int, transaction_id: int, id_tag: Optional[str], meter_start: float):
+        """Open the Active session, resetting the RFID card's remaining wattage when it has a limit"""
+        db = SessionLocal()
+        try:
             # Initialize remaining_wattage from wattage_limit if RFID card has a limit set
             initial_remaining_wattage = None
             if id_tag:
@@ -751,7 +1044,6 @@ class OCPPHandler:
                     # If remaining_wattage is None or less than limit, reset it to limit
                     if rfid_card.remaining_wattage is None or rfid_card.remaining_wattage < rfid_card.wattage_limit:
                         rfid_card.remaining_wattage = rfid_card.wattage_limit
-                        db.commit()
                         logger.info(f"Initialized remaining_wattage to {rfid_card.wattage_limit} Wh for RFID card {id_tag}")
                     
                     # Store the initial remaining_wattage for this transaction
@@ -762,7 +1054,7 @@ class OCPPHandler:
             if initial_remaining_wattage is not None:
                 session_metadata["initial_remaining_wattage"] = initial_remaining_wattage
             
-            session = Session(
+            db.add(Session(
                 charger_id=charger_id,
                 connector_id=connector_id,
                 transaction_id=transaction_id,
@@ -771,63 +1063,58 @@ class OCPPHandler:
                 status="Active",
                 meter_start=meter_start,  # Store meterStart from StartTransaction
                 session_metadata=session_metadata
-            )
-            db.add(session)
+            ))
+            # The card reset and the new session are committed together
             db.commit()
-            
-            logger.info(f"StartTransaction: charger_id={charger_id}, transaction_id={transaction_id}, id_tag={id_tag}, meter_start={meter_start} Wh")
-            
-            # Create proper StartTransactionPayload using OCPP library
-            start_response = call_result.StartTransactionPayload(
-                transaction_id=transaction_id,
-                id_tag_info={'status': AuthorizationStatus.accepted}
-            )
-            start_dict = asdict_camelcase(start_response)
-            
-            return [3, message_id, start_dict]
         finally:
             db.close()
 
     async def handle_stop_transaction(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
+        transaction_id = payload.get("transactionId")
+        # Ensure transaction_id is an integer
+        if transaction_id is not None:
+            transaction_id = int(transaction_id)
+        await self.run_db(self.record_stop_transaction, charger_id, transaction_id, payload.get("meterStop"))
+        
+        # Create proper StopTransactionPayload using OCPP library
+        stop_response = call_result.StopTransactionPayload(
+            id_tag_info={'status': AuthorizationStatus.accepted}
+        )
+        stop_dict = asdict_camelcase(stop_response)
+        
+        return [3, message_id, stop_dict]
+
+    def record_stop_transaction(self, charger_id: str, transaction_id: Optional[int], meter_stop: Optional[int]):
+        """Complete a session with one UPDATE, reading only the columns the totals depend on"""
         db = SessionLocal()
         try:
-            transaction_id = payload.get("transactionId")
-            # Ensure transaction_id is an integer
-            if transaction_id is not None:
-                transaction_id = int(transaction_id)
+            session_filter = (Session.transaction_id == transaction_id, Session.charger_id == charger_id)
+            row = db.query(Session.meter_start, Session.start_time).filter(*session_filter).first()
+            if row is None:
+                return
+            meter_start, session_start_time = row
             
-            session = db.query(Session).filter(Session.transaction_id == transaction_id, Session.charger_id == charger_id).first()
-            if session:
-                # Set stop_time to current time in Egypt timezone
-                stop_time = get_egypt_now()
-                # Ensure stop_time is timezone-aware (should be from get_egypt_now(), but be defensive)
-                if stop_time.tzinfo is None:
-                    stop_time = to_egypt_timezone(stop_time)
-                session.stop_time = stop_time
-                session.meter_stop = payload.get("meterStop")
-                session.energy_delivered = (session.meter_stop - session.meter_start) / 1000 if session.meter_start and session.meter_stop else 0
-
-                # Calculate duration in seconds: stop_time - start_time
-                if session.start_time is not None:
-                    # Ensure both datetimes are timezone-aware before subtraction
-                    # Convert start_time to timezone-aware datetime in Egypt timezone
-                    start_time = to_egypt_timezone(session.start_time)
-                    
-                    duration_seconds = int((stop_time - start_time).total_seconds())
-                    if duration_seconds < 0:
-                        duration_seconds = 0
-                    session.duration = duration_seconds
+            # Set stop_time to current time in Egypt timezone
+            stop_time = get_egypt_now()
+            # Ensure stop_time is timezone-aware (should be from get_egypt_now(), but be defensive)
+            if stop_time.tzinfo is None:
+                stop_time = to_egypt_timezone(stop_time)
+            values = {
+                Session.stop_time: stop_time,
+                Session.meter_stop: meter_stop,
+                Session.energy_delivered: (meter_stop - meter_start) / 1000 if meter_start and meter_stop else 0,
+                Session.status: "Completed"
+            }
 
-                session.status = "Completed"
-                db.commit()
-            
-            # Create proper StopTransactionPayload using OCPP library
-            stop_response = call_result.StopTransactionPayload(
-                id_tag_info={'status': AuthorizationStatus.accepted}
-            )
-            stop_dict = asdict_camelcase(stop_response)
-            
-            return [3, message_id, stop_dict]
+            # Calculate duration in seconds: stop_time - start_time
+            if session_start_time is not None:
+                # Ensure both datetimes are timezone-aware before subtraction
+                # Convert start_time to timezone-aware datetime in Egypt timezone
+                start_time = to_egypt_timezone(session_start_time)
+                values[Session.duration] = max(int((stop_time - start_time).total_seconds()), 0)
+
+            db.query(Session).filter(*session_filter).update(values, synchronize_session=False)
+            db.commit()
         finally:
             db.close()
 
@@ -836,7 +1123,6 @@ class OCPPHandler:
         Handle Authorize request - Check RFID card in database
         Returns Accepted if card exists and is active, Rejected otherwise
         """
-        db = SessionLocal()
         try:
             id_tag = payload.get("idTag")
             
@@ -851,7 +1137,7 @@ class OCPPHandler:
                 return [3, message_id, authorize_dict]
             
             # Check if RFID card exists in database
-            rfid_card = db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).first()
+            rfid_card = await self.get_rfid_card_auth(id_tag)
             
             if not rfid_card:
                 logger.info(f"RFID card {id_tag} not found in database - REJECTED")
@@ -861,10 +1147,11 @@ class OCPPHandler:
                 authorize_dict = asdict_camelcase(authorize_response)
                 return [3, message_id, authorize_dict]
             
-            logger.info(f"RFID card found: id_tag={rfid_card.id_tag}, is_active={rfid_card.is_active}, is_blocked={rfid_card.is_blocked}, expires_at={rfid_card.expires_at}")
+            is_blocked, is_active, expires_at = rfid_card
+            logger.info(f"RFID card found: id_tag={id_tag}, is_active={is_active}, is_blocked={is_blocked}, expires_at={expires_at}")
             
             # Check if card is blocked
-            if rfid_card.is_blocked:
+            if is_blocked:
                 logger.warning(f"RFID card {id_tag} is blocked - REJECTED")
                 authorize_response = call_result.AuthorizePayload(
                     id_tag_info={'status': AuthorizationStatus.blocked}
@@ -873,7 +1160,7 @@ class OCPPHandler:
                 return [3, message_id, authorize_dict]
             
             # Check if card is active
-            if not rfid_card.is_active:
+            if not is_active:
                 logger.warning(f"RFID card {id_tag} is inactive - REJECTED")
                 authorize_response = call_result.AuthorizePayload(
                     id_tag_info={'status': AuthorizationStatus.invalid}
@@ -883,9 +1170,8 @@ class OCPPHandler:
             
             # Check if card is expired
             current_time = get_egypt_now()
-            if rfid_card.expires_at:
+            if expires_at:
                 # Make both datetimes timezone-aware for comparison
-                expires_at = rfid_card.expires_at
                 # If expires_at is naive, make it timezone-aware using current timezone
                 if expires_at.tzinfo is None:
                     # Assume it's in the same timezone as current_time
@@ -900,9 +1186,8 @@ class OCPPHandler:
                     authorize_dict = asdict_camelcase(authorize_response)
                     return [3, message_id, authorize_dict]
             
-            # Card is valid - update last_used_at
-            rfid_card.last_used_at = get_egypt_now()
-            db.commit()
+            # Card is valid - update last_used_at without holding up the reply
+            self.db_executor.submit(self.touch_rfid_card, id_tag, current_time)
             
             logger.info(f"RFID card {id_tag} authorized successfully - ACCEPTED")
             authorize_response = call_result.AuthorizePayload(
@@ -920,9 +1205,43 @@ class OCPPHandler:
             )
             authorize_dict = asdict_camelcase(authorize_response)
             return [3, message_id, authorize_dict]
+
+    async def get_rfid_card_auth(self, id_tag: str) -> Optional[Tuple[bool, bool, Optional[datetime]]]:
+        """(is_blocked, is_active, expires_at) for an RFID card, or None if unknown, served from
+        memory for AUTHORIZE_CACHE_TTL; expiry itself is still checked against the current time"""
+        cached = self.authorize_cache.pop(id_tag, None)
+        if cached and monotonic() - cached[0] < AUTHORIZE_CACHE_TTL:
+            self.authorize_cache[id_tag] = cached
+            return cached[1]
+        card = await self.run_db(self.load_rfid_card_auth, id_tag)
+        while len(self.authorize_cache) >= AUTHORIZE_CACHE_SIZE:
+            self.authorize_cache.pop(next(iter(self.authorize_cache)))
+        self.authorize_cache[id_tag] = (monotonic(), card)
+        return card
+
+    def load_rfid_card_auth(self, id_tag: str) -> Optional[Tuple[bool, bool, Optional[datetime]]]:
+        db = SessionLocal()
+        try:
+            row = db.query(RFIDCard.is_blocked, RFIDCard.is_active, RFIDCard.expires_at).filter(RFIDCard.id_tag == id_tag).first()
+            return tuple(row) if row else None
         finally:
             db.close()
 
+    def touch_rfid_card(self, id_tag: str, used_at: datetime):
+        db = SessionLocal()
+        try:
+            db.query(RFIDCard).filter(RFIDCard.id_tag == id_tag).update({RFIDCard.last_used_at: used_at}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to update last_used_at for RFID card {id_tag}: {e}")
+        finally:
+            db.close()
+
+    def invalidate_authorize_cache(self, *id_tags: str):
+        """Forget cached authorization fields for the given id_tags"""
+        for id_tag in id_tags:
+            self.authorize_cache.pop(id_tag, None)
+
     async def handle_data_transfer(self, charger_id: str, message_id: str, payload: Dict[str, Any]) -> List[Any]:
         """Handle DataTransfer message from charger"""
         vendor_id = payload.get("vendorId")
@@ -1141,32 +1460,49 @@ class OCPPHandler:
         """Handle response to UpdateFirmware command"""
         logger.info(f"UpdateFirmware response from {charger_id}")
 
-    async def send_message_to_charger(self, charger_id: str, message: List[Any], processing_time: float = 0.0) -> bool:
-        ws = self.charger_connections.get(charger_id)
-        if not ws:
+    async def send_message_to_charger(self, charger_id: str, message: List[Any], processing_time: float = 0.0,
+                                      message_json: Optional[str] = None) -> bool:
+        if charger_id not in self.charger_connections:
             logger.error(f"No WebSocket connection found for charger {charger_id}")
             self.stats["messages_failed"] += 1
             return False
 
-        message_id = message[1] if len(message) > 1 else str(uuid.uuid4())
-        start_time = time()
+        message_id = message[1] if len(message) > 1 else new_message_id()
+        retry_config = None
+        if message[0] == 2 and self.retry_task:
+            # Resolve the charger's retry policy before the frame goes out, so a failed DB read
+            # can't report a CALL that was actually sent as failed; the PendingMessage defaults apply
+            try:
+                retry_config = (await self.run_db(self.load_retry_configs, {charger_id}))[charger_id]
+            except Exception as e:
+                logger.error(f"Error loading retry settings for {charger_id}, using defaults: {e}")
         try:
-            message_json = json.dumps(message)
-            logger.info(f"Sending message to charger {charger_id}: {message_json}")
-            await ws.send(message_json)
-            await self.forward_to_masters(charger_id, self.connection_ids.get(charger_id, str(uuid.uuid4())), message, "outgoing", processing_time or (time() - start_time))
-            self.stats["messages_sent"] += 1
+            if message_json is None:
+                message_json = dumps_text(message)
+            # Outgoing frames are stored in MessageLog too; only echo them when debugging
+            logger.debug("Sending message to charger %s: %s", charger_id, message_json)
+            # The charger's writer task does the actual send and forwards it to masters
+            if not self.enqueue_for_charger(charger_id, message, message_json, processing_time):
+                return False
             if message[0] == 2:
-                action = message[2] if len(message) > 2 else "Unknown"
-                logger.info(f"Added message to pending queue for charger {charger_id}: message_id={message_id}, action={action}")
-                self.pending_messages[message_id] = PendingMessage(
+                if logger.isEnabledFor(logging.DEBUG):
+                    action = message[2] if len(message) > 2 else "Unknown"
+                    logger.debug("Added message to pending queue for charger %s: message_id=%s, action=%s", charger_id, message_id, action)
+                pending = PendingMessage(
                     message_id=message_id,
                     charger_id=charger_id,
                     action=message[2],
                     payload=message[3],
-                    timestamp=get_egypt_now()
+                    timestamp=monotonic()
                 )
-                self.stats["pending_messages"] += 1
+                # Stamp the charger's retry policy now so the retry loop never reads the DB
+                if retry_config is not None:
+                    pending.max_retries = retry_config["max_retries"]
+                    pending.retry_interval = retry_config["retry_interval"]
+                    pending.retry_enabled = retry_config["retry_enabled"]
+                self.add_pending_message(pending)
+                if self.retry_task:
+                    self.schedule_retry(charger_id, message_id, pending.retry_interval)
             return True
         except Exception as e:
             logger.error(f"Error sending message to {charger_id}: {e}")
@@ -1174,159 +1510,269 @@ class OCPPHandler:
             return False
 
     async def broadcast_to_chargers(self, message: List[Any]):
-        message_id = message[1] if len(message) > 1 else str(uuid.uuid4())
-        start_time = time()
-        for charger_id, ws in list(self.charger_connections.items()):
-            try:
-                await ws.send(json.dumps(message))
-                await self.forward_to_masters(charger_id, self.connection_ids.get(charger_id, str(uuid.uuid4())), message, "outgoing", time() - start_time)
-                self.stats["messages_sent"] += 1
-            except Exception as e:
-                logger.error(f"Error broadcasting to {charger_id}: {e}")
-                self.stats["messages_failed"] += 1
+        # Serialize once; each charger's writer sends it independently
+        message_json = dumps_text(message)
+        for charger_id in list(self.charger_send_queues):
+            self.enqueue_for_charger(charger_id, message, message_json)
+
+    def get_system_config(self, key: str) -> Optional[str]:
+        """Return a SystemConfig value, reading the DB at most once per SYSTEM_CONFIG_TTL per key"""
+        cached = self.system_config_cache.get(key)
+        if cached and monotonic() - cached[0] < SYSTEM_CONFIG_TTL:
+            return cached[1]
+        db = SessionLocal()
+        try:
+            row = db.query(SystemConfig).filter(SystemConfig.key == key).first()
+            value = row.value if row else None
+        finally:
+            db.close()
+        self.system_config_cache[key] = (monotonic(), value)
+        return value
+
+    def load_retry_configs(self, charger_ids: Set[str]) -> Dict[str, Dict[str, Any]]:
+        """Retry settings for each charger, falling back to the system defaults"""
+        max_retries = self.get_system_config("max_retries")
+        retry_interval = self.get_system_config("retry_interval")
+        defaults = {
+            "max_retries": int(max_retries) if max_retries else 3,
+            "retry_interval": int(retry_interval) if retry_interval else 5,
+            "retry_enabled": True,
+        }
 
-    async def message_processor(self):
-        while True:
-            try:
-                await asyncio.sleep(1)
-                # Placeholder for message queue processing
-            except asyncio.CancelledError:
-                break
+        now = monotonic()
+        configs = {}
+        for charger_id in charger_ids:
+            cached = self.retry_config_cache.get(charger_id)
+            if cached and now - cached[0] < RETRY_CONFIG_TTL:
+                configs[charger_id] = cached[1]
+        missing = [charger_id for charger_id in charger_ids if charger_id not in configs]
+        if not missing:
+            return configs
+
+        loaded = {charger_id: dict(defaults) for charger_id in missing}
+        db = SessionLocal()
+        try:
+            rows = db.query(Charger.id, Charger.max_retries, Charger.retry_interval, Charger.retry_enabled).filter(Charger.id.in_(missing)).all()
+        finally:
+            db.close()
+        for charger_id, charger_max_retries, charger_retry_interval, retry_enabled in rows:
+            config = loaded[charger_id]
+            if charger_max_retries is not None:
+                config["max_retries"] = charger_max_retries
+            if charger_retry_interval is not None:
+                config["retry_interval"] = charger_retry_interval
+            if retry_enabled is not None:
+                config["retry_enabled"] = retry_enabled
+
+        for charger_id, config in loaded.items():
+            self.retry_config_cache.pop(charger_id, None)
+            while len(self.retry_config_cache) >= RETRY_CONFIG_CACHE_SIZE:
+                self.retry_config_cache.pop(next(iter(self.retry_config_cache)))
+            self.retry_config_cache[charger_id] = (now, config)
+        configs.update(loaded)
+        return configs
+
+    def invalidate_retry_config(self, charger_id: Optional[str] = None):
+        """Forget cached retry settings for one charger, or for all chargers and the system defaults"""
+        if charger_id is not None:
+            self.retry_config_cache.pop(charger_id, None)
+            return
+        self.retry_config_cache.clear()
+        self.system_config_cache.pop("max_retries", None)
+        self.system_config_cache.pop("retry_interval", None)
+
+    def schedule_retry(self, charger_id: str, message_id: str, delay: float):
+        """Queue a pending CALL for a retry check once delay seconds have passed"""
+        if not self.retry_heap:
+            self.retry_wakeup.set()
+        heapq.heappush(self.retry_heap, (monotonic() + delay, charger_id, message_id))
 
     async def retry_pending_messages(self):
+        """Resend unanswered CALLs as their retry deadlines come due, backing off exponentially"""
         while True:
             try:
-                db = SessionLocal()
-                try:
-                    retry_config = db.query(SystemConfig).filter(SystemConfig.key == "retry_config").first()
-                    retry_config = json.loads(retry_config.value) if retry_config else {"max_retries": 3, "retry_interval": 30}
-                finally:
-                    db.close()
-
-                for message_id, pending_msg in list(self.pending_messages.items()):
+                if not self.retry_heap:
+                    self.retry_wakeup.clear()
+                    await self.retry_wakeup.wait()
+                    continue
+                delay = self.retry_heap[0][0] - monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                now = monotonic()
+                due = []
+                while self.retry_heap and self.retry_heap[0][0] <= now:
+                    _, charger_id, message_id = heapq.heappop(self.retry_heap)
+                    due.append((charger_id, message_id))
+
+                for charger_id, message_id in due:
+                    pending_msg = self.pending_by_charger.get(charger_id, {}).get(message_id)
+                    # Answered or dropped since it was scheduled
+                    if pending_msg is None:
+                        continue
                     # Check if charging point has responded - stop retrying
                     if pending_msg.response_received:
                         logger.info(f"Message {message_id} received response, removing from retry queue")
-                        self.pending_messages.pop(message_id, None)
-                        self.stats["pending_messages"] -= 1
+                        self.pop_pending_message(charger_id, message_id)
+                        continue
+                    
+                    if not pending_msg.retry_enabled:
+                        logger.info(f"Retries disabled for charger {charger_id}, dropping message {message_id} from retry queue")
+                        self.pop_pending_message(charger_id, message_id)
                         continue
                     
                     # Check if max retries reached - stop retrying
                     if pending_msg.retry_count >= pending_msg.max_retries:
                         logger.warning(f"Message {message_id} reached max retries ({pending_msg.max_retries}), stopping retries")
-                        self.pending_messages.pop(message_id, None)
-                        self.stats["pending_messages"] -= 1
+                        self.pop_pending_message(charger_id, message_id)
                         continue
                     
                     # Check if timeout elapsed - stop retrying
-                    time_elapsed = (get_egypt_now() - pending_msg.timestamp).total_seconds()
-                    if time_elapsed > pending_msg.response_timeout:
+                    time_elapsed = monotonic() - pending_msg.timestamp
+                    if time_elapsed >= pending_msg.response_timeout:
                         logger.warning(f"Message {message_id} timed out after {pending_msg.response_timeout}s, stopping retries")
-                        self.pending_messages.pop(message_id, None)
-                        self.stats["pending_messages"] -= 1
+                        self.pop_pending_message(charger_id, message_id)
                         continue
                     
                     # Check if charger is disconnected - stop retrying
-                    if pending_msg.charger_id not in self.charger_connections:
-                        logger.warning(f"Charger {pending_msg.charger_id} is disconnected, stopping retries for message {message_id}")
-                        self.pending_messages.pop(message_id, None)
-                        self.stats["pending_messages"] -= 1
+                    if charger_id not in self.charger_connections:
+                        logger.warning(f"Charger {charger_id} is disconnected, stopping retries for message {message_id}")
+                        self.pop_pending_message(charger_id, message_id)
                         continue
                     
-                    # Check if retry interval has elapsed
-                    if pending_msg.last_send_attempt and (get_egypt_now() - pending_msg.last_send_attempt).total_seconds() < retry_config["retry_interval"]:
-                        continue
-                    
-                    # Retry the message
+                    # Retry the message; enqueue directly so the existing pending entry (and its retry_count) is kept
                     pending_msg.retry_count += 1
-                    pending_msg.last_send_attempt = get_egypt_now()
-                    success = await self.send_message_to_charger(charger_id=pending_msg.charger_id, message=[2, message_id, pending_msg.action, pending_msg.payload])
+                    pending_msg.last_send_attempt = monotonic()
+                    message = [2, message_id, pending_msg.action, pending_msg.payload]
+                    success = self.enqueue_for_charger(charger_id, message, dumps_text(message))
                     pending_msg.send_successful = success
                     if not success:
                         logger.warning(f"Retry {pending_msg.retry_count}/{pending_msg.max_retries} failed for message {message_id}")
+                    # Wake again at the next backoff or at the response timeout, whichever is sooner,
+                    # so expired CALLs leave pending_by_charger on time rather than at a later retry
+                    backoff = pending_msg.retry_interval * 2 ** pending_msg.retry_count
+                    expires_in = pending_msg.timestamp + pending_msg.response_timeout - monotonic()
+                    self.schedule_retry(charger_id, message_id, max(0.0, min(backoff, expires_in)))
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in retry task: {e}")
-            await asyncio.sleep(10)
+                await asyncio.sleep(1)
 
     async def heartbeat_monitor(self):
         while True:
             try:
-                db = SessionLocal()
-                try:
-                    chargers = db.query(Charger).all()
-                    for charger in chargers:
-                        if charger.is_connected and charger.last_heartbeat:
-                            # Convert last_heartbeat to timezone-aware if needed
-                            heartbeat_time = to_egypt_timezone(charger.last_heartbeat) if charger.last_heartbeat else None
-                            if heartbeat_time and (get_egypt_now() - heartbeat_time).total_seconds() > 600:
-                                charger.is_connected = False
-                                db.add(ConnectionEvent(charger_id=charger.id, event_type="TIMEOUT", timestamp=get_egypt_now()))
-                                db.commit()
-                        # Removed heartbeat sending logic - only charging points should send heartbeats
-                        # The central system should only monitor for received heartbeats
-                finally:
-                    db.close()
+                # Removed heartbeat sending logic - only charging points should send heartbeats
+                # The central system should only monitor for received heartbeats
+                if await self.run_db(self.expire_stale_chargers):
+                    self.connection_events_cache.clear()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in heartbeat monitor: {e}")
             await asyncio.sleep(60)
 
-    async def keepalive_monitor(self):
-        while True:
-            try:
-                disconnected = []
-                for charger_id, ws in list(self.charger_connections.items()):
-                    if ws.closed:
-                        disconnected.append(charger_id)
-                for charger_id in disconnected:
-                    self.charger_connections.pop(charger_id, None)
-                    self.connection_ids.pop(charger_id, None)
-                    self.stats["connections_active"] -= 1
-                    db = SessionLocal()
-                    try:
-                        charger = db.query(Charger).filter(Charger.id == charger_id).first()
-                        if charger:
-                            charger.is_connected = False
-                        db.add(ConnectionEvent(charger_id=charger_id, event_type="DISCONNECT", timestamp=get_egypt_now()))
-                        db.commit()
-                    finally:
-                        db.close()
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Error in keepalive monitor: {e}")
-            await asyncio.sleep(10)
+    def expire_stale_chargers(self) -> List[str]:
+        """Mark chargers silent for over 10 minutes as disconnected, log TIMEOUT for each, and return their ids"""
+        # last_heartbeat is stored naive in Egypt local time, so compare against a naive threshold
+        threshold = (get_egypt_now() - timedelta(seconds=600)).replace(tzinfo=None)
+        db = SessionLocal()
+        try:
+            stale_ids = [charger_id for charger_id, in db.query(Charger.id).filter(
+                Charger.is_connected == True,
+                Charger.last_heartbeat < threshold
+            ).all()]
+            if stale_ids:
+                db.query(Charger).filter(Charger.id.in_(stale_ids)).update(
+                    {Charger.is_connected: False}, synchronize_session=False
+                )
+                now = get_egypt_now()
+                db.add_all([ConnectionEvent(charger_id=charger_id, event_type="TIMEOUT", timestamp=now) for charger_id in stale_ids])
+                db.commit()
+            return stale_ids
+        finally:
+            db.close()
 
     async def log_message(self, charger_id: str, message_type: str, action: str, message_id: str,
                          status: str, processing_time: Optional[float], request: Optional[str], response: Optional[str]):
+        self.queue_message_log({
+            "timestamp": get_egypt_now(),
+            "charger_id": charger_id,
+            "message_type": message_type,
+            "action": action,
+            "message_id": message_id,
+            "status": status,
+            "processing_time": processing_time,
+            "request": request,
+            "response": response
+        })
+
+    async def run_db(self, func: Callable, *args: Any) -> Any:
+        """Run a blocking DB function on the DB thread pool and await its result"""
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, func, *args)
+
+    def queue_message_log(self, row: Dict[str, Any]):
+        """Hand a MessageLog row to the background writer without blocking the caller"""
+        try:
+            self.message_log_queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["message_logs_dropped"] += 1
+
+    def insert_message_logs(self, rows: List[Dict[str, Any]]):
         db = SessionLocal()
         try:
-            log_entry = MessageLog(
-                timestamp=get_egypt_now(),
-                charger_id=charger_id,
-                message_type=message_type,
-                action=action,
-                message_id=message_id,
-                status=status,
-                processing_time=processing_time,
-                request=request,
-                response=response
-            )
-            db.add(log_entry)
+            db.bulk_insert_mappings(MessageLog, rows)
             db.commit()
+        except Exception:
+            db.rollback()
+            raise
         finally:
             db.close()
 
+    async def message_log_writer(self):
+        """Bulk-insert queued MessageLog rows in batches off the event loop"""
+        batch: List[Dict[str, Any]] = []
+        try:
+            while True:
+                batch.append(await self.message_log_queue.get())
+                await fill_batch(self.message_log_queue, batch, MESSAGE_LOG_BATCH_MAX, MESSAGE_LOG_BATCH_WINDOW)
+                rows, batch = batch, []
+                try:
+                    await self.run_db(self.insert_message_logs, rows)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(rows)} message logs: {e}")
+        except asyncio.CancelledError:
+            batch.extend(drain_queue(self.message_log_queue))
+            if batch:
+                try:
+                    self.insert_message_logs(batch)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} message logs on shutdown: {e}")
+            raise
+
     def get_stats(self) -> Dict[str, Any]:
         return self.stats.copy()
 
-    def get_connection_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+    def get_connection_events(self, charger_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest connection events, newest first, as plain dicts ready for ConnectionEventResponse"""
+        cached = self.connection_events_cache.get((charger_id, limit))
+        if cached is not None:
+            return cached
+        # Column rows via Core skip ORM instance construction for rows that are only serialized
+        stmt = select(*ConnectionEvent.__table__.columns).order_by(ConnectionEvent.timestamp.desc()).limit(limit)
+        if charger_id is not None:
+            stmt = stmt.where(ConnectionEvent.charger_id == charger_id)
         db = SessionLocal()
         try:
-            events = db.query(ConnectionEvent).order_by(ConnectionEvent.timestamp.desc()).limit(limit).all()
-            return [asdict(event) for event in events]
+            rows = db.execute(stmt).mappings().all()
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
+        events = [
+            {**row, "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None}
+            for row in rows
+        ]
+        while len(self.connection_events_cache) >= CONNECTION_EVENTS_CACHE_SIZE:
+            self.connection_events_cache.pop(next(iter(self.connection_events_cache)))
+        self.connection_events_cache[(charger_id, limit)] = events
+        return events
\ No newline at end of file
@@ -398,13 +398,12 @@ class SessionManager:
                 await asyncio.sleep(3600)  # Run every hour
                 
                 # Clean up old completed sessions from memory
-                current_time = datetime.utcnow()
-                old_sessions = []
-                
-                for session_id, session in self.active_sessions.items():
-                    # Remove sessions that have been inactive for more than 24 hours
-                    if (current_time - session.start_time).total_seconds() > 86400:
-                        old_sessions.append(session_id)
+                # Remove sessions that have been inactive for more than 24 hours
+                cutoff = datetime.utcnow() - timedelta(days=1)
+                old_sessions = [
+                    session_id for session_id, session in self.active_sessions.items()
+                    if session.start_time < cutoff
+                ]
                 
                 for session_id in old_sessions:
                     if session_id in self.active_sessions:
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import sys
 from datetime import datetime
 import ssl
 import websockets
@@ -842,4 +843,11 @@ async def main():
         logging.error(f"Server failed: {e}")
 
 if __name__ == "__main__":
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            uvloop.install()
+            logging.info("Using uvloop event loop")
+        except ImportError:
+            pass
     asyncio.run(main())
@@ -0,0 +1,44 @@
+"""
+Migration script to add the list endpoint and OCPP lookup indexes to existing tables
+Run this script to create the RFID card, user, charger, connector and connection event indexes declared on the models
+(Base.metadata.create_all only creates indexes for newly created tables)
+"""
+from sqlalchemy import text
+from app.models.database import engine, RFIDCard, User, Charger, Connector, ConnectionEvent
+
+# Trigram indexes for the list_users substring search (PostgreSQL only)
+TRIGRAM_INDEXES = {
+    "ix_user_uname_trgm": "username",
+    "ix_user_email_trgm": "email",
+}
+
+def create_list_indexes():
+    """Create any model indexes missing from the rfid_cards, users, chargers, connectors and connection_events tables"""
+    for table in (RFIDCard.__table__, User.__table__, Charger.__table__, Connector.__table__, ConnectionEvent.__table__):
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            index.create(bind=engine, checkfirst=True)
+            print(f"   ✅ {table.name}.{index.name}")
+
+def create_search_indexes():
+    """Create pg_trgm GIN indexes so ILIKE '%search%' is an index probe"""
+    if engine.dialect.name != "postgresql":
+        print("   ℹ️  Trigram search indexes require PostgreSQL. Skipping...")
+        return
+    
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for index_name, column in TRIGRAM_INDEXES.items():
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON users USING gin ({column} gin_trgm_ops)"
+            ))
+            print(f"   ✅ users.{index_name}")
+
+if __name__ == "__main__":
+    print("Creating list endpoint indexes...")
+    try:
+        create_list_indexes()
+        create_search_indexes()
+        print("✅ Indexes created successfully!")
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
+        exit(1)
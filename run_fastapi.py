@@ -49,5 +49,6 @@ if __name__ == "__main__":
         port=8001,
         reload=True,
         log_level="info",
+        loop="auto",  # uvloop when installed, asyncio otherwise
         **ssl_kwargs
     )
@@ -0,0 +1,35 @@
+"""
+Shared fixtures for the unit tests, run against a throwaway SQLite database
+"""
+import os
+import tempfile
+
+# Point the app at a scratch database before app.models.database creates its engine
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.database import Base, SessionLocal, engine
+from app.routers import rfid_cards, users
+
+@pytest.fixture
+def db():
+    """Session on freshly created tables"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client(db):
+    """Client for the RFID card and user routers, sharing the db fixture's tables"""
+    app = FastAPI()
+    app.include_router(rfid_cards.router, prefix="/api")
+    app.include_router(users.router, prefix="/api")
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,54 @@
+"""
+MQ bridge event delivery accounting
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import orjson
+
+from app.services.mq_bridge import EventMessage, MQBridge
+
+def make_event(data):
+    return EventMessage(event_type="MeterValues", charger_id="CP1", data=data, timestamp=datetime.now(timezone.utc))
+
+def make_bridge(status=200):
+    bridge = MQBridge(use_redis=False)
+    bridge.posted = []
+    
+    async def http_post(url, body):
+        bridge.posted.append((url, orjson.loads(body)))
+        return status
+    
+    bridge.http_post = http_post
+    return bridge
+
+def test_unserializable_event_does_not_fail_the_batch():
+    bridge = make_bridge()
+    # orjson can't serialize a set
+    events = [make_event({"value": 1}), make_event({"bad": {1, 2}}), make_event({"value": 2})]
+    
+    asyncio.run(bridge.deliver_events(events))
+    
+    (url, body), = bridge.posted
+    assert url.endswith("/batch")
+    assert [event["data"] for event in body["events"]] == [{"value": 1}, {"value": 2}]
+    assert bridge.events_sent == 2
+    assert bridge.events_failed == 1
+
+def test_unserializable_event_is_skipped_when_posting_one_by_one():
+    bridge = make_bridge()
+    bridge.http_batch_supported = False
+    
+    asyncio.run(bridge.deliver_events([make_event({"bad": {1}}), make_event({"value": 1})]))
+    
+    assert [body["data"] for _, body in bridge.posted] == [{"value": 1}]
+    assert bridge.events_sent == 1
+    assert bridge.events_failed == 1
+
+def test_rejected_batch_without_redis_counts_as_failed():
+    bridge = make_bridge(status=500)
+    
+    asyncio.run(bridge.deliver_events([make_event({"value": 1}), make_event({"value": 2})]))
+    
+    assert bridge.events_sent == 0
+    assert bridge.events_failed == 2
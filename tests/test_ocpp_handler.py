@@ -0,0 +1,164 @@
+"""
+OCPP handler state kept in memory between DB writes
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import DataError, OperationalError
+
+from app.models.database import Charger, Session
+from app.services import ocpp_handler as ocpp_handler_module
+from app.services.ocpp_handler import OCPPHandler
+
+@pytest.fixture
+def handler():
+    handler = OCPPHandler(None, None)
+    try:
+        yield handler
+    finally:
+        handler.db_executor.shutdown(wait=True)
+
+def run_heartbeat_writer(handler, seconds=0.05):
+    async def run():
+        task = asyncio.create_task(handler.heartbeat_writer())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(run())
+
+def test_heartbeat_flush_skips_missing_charger_rows(handler, db):
+    db.add(Charger(id="CP1", is_connected=True, last_heartbeat=datetime(2025, 1, 1)))
+    db.commit()
+    heartbeat = datetime(2025, 3, 1, 12, 0, 0)
+    
+    # CP2 has no row, e.g. it was deleted while still connected
+    handler.write_heartbeats({"CP1": heartbeat, "CP2": heartbeat})
+    
+    db.expire_all()
+    assert db.get(Charger, "CP1").last_heartbeat == heartbeat
+    assert db.get(Charger, "CP2") is None
+
+def test_heartbeat_writer_drops_batches_that_fail_on_their_data(handler, monkeypatch):
+    monkeypatch.setattr(ocpp_handler_module, "HEARTBEAT_FLUSH_INTERVAL", 0)
+    calls = []
+    
+    def write_heartbeats(heartbeats):
+        calls.append(dict(heartbeats))
+        raise DataError("UPDATE chargers", {}, Exception("bad value"))
+    
+    monkeypatch.setattr(handler, "write_heartbeats", write_heartbeats)
+    handler.heartbeat_buffer["CP1"] = datetime(2025, 3, 1, 12, 0, 0)
+    
+    run_heartbeat_writer(handler)
+    
+    assert len(calls) == 1
+    assert handler.heartbeat_buffer == {}
+
+def test_heartbeat_writer_retries_after_connection_errors(handler, monkeypatch):
+    monkeypatch.setattr(ocpp_handler_module, "HEARTBEAT_FLUSH_INTERVAL", 0)
+    calls = []
+    
+    def write_heartbeats(heartbeats):
+        calls.append(dict(heartbeats))
+        if len(calls) == 1:
+            raise OperationalError("UPDATE chargers", {}, Exception("database is locked"))
+    
+    monkeypatch.setattr(handler, "write_heartbeats", write_heartbeats)
+    heartbeat = datetime(2025, 3, 1, 12, 0, 0)
+    handler.heartbeat_buffer["CP1"] = heartbeat
+    
+    run_heartbeat_writer(handler)
+    
+    assert calls[:2] == [{"CP1": heartbeat}, {"CP1": heartbeat}]
+    assert handler.heartbeat_buffer == {}
+
+def send_call(handler, charger_id="CP1"):
+    async def run():
+        handler.charger_connections[charger_id] = object()
+        handler.charger_send_queues[charger_id] = asyncio.Queue()
+        # Any truthy task enables retry scheduling; the loop itself isn't needed here
+        handler.retry_task = object()
+        sent = await handler.send_message_to_charger(charger_id, [2, "msg-1", "Reset", {"type": "Soft"}])
+        return sent, handler.charger_send_queues[charger_id].qsize()
+    return asyncio.run(run())
+
+def test_send_call_stamps_the_chargers_retry_policy(handler, db):
+    db.add(Charger(id="CP1", max_retries=7, retry_interval=11, retry_enabled=False))
+    db.commit()
+    
+    assert send_call(handler) == (True, 1)
+    
+    pending = handler.pending_by_charger["CP1"]["msg-1"]
+    assert (pending.max_retries, pending.retry_interval, pending.retry_enabled) == (7, 11, False)
+    assert [entry[1:] for entry in handler.retry_heap] == [("CP1", "msg-1")]
+
+def test_send_call_uses_default_retry_policy_when_it_cannot_be_loaded(handler, monkeypatch):
+    def load_retry_configs(charger_ids):
+        raise OperationalError("SELECT chargers", {}, Exception("database is locked"))
+    
+    monkeypatch.setattr(handler, "load_retry_configs", load_retry_configs)
+    
+    assert send_call(handler) == (True, 1)
+    
+    pending = handler.pending_by_charger["CP1"]["msg-1"]
+    assert (pending.max_retries, pending.retry_interval, pending.retry_enabled) == (3, 5, True)
+    assert [entry[1:] for entry in handler.retry_heap] == [("CP1", "msg-1")]
+    assert handler.stats["messages_failed"] == 0
+
+class FakeWebSocket:
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+def test_failed_connect_write_releases_the_charger_id(handler, monkeypatch):
+    def record_charger_connected(charger_id):
+        raise OperationalError("UPDATE chargers", {}, Exception("database is locked"))
+    
+    disconnected = []
+    monkeypatch.setattr(handler, "record_charger_connected", record_charger_connected)
+    monkeypatch.setattr(handler, "record_chargers_disconnected", disconnected.extend)
+    
+    async def run():
+        with pytest.raises(OperationalError):
+            await handler.handle_charger_connection(FakeWebSocket(), "CP1")
+        await asyncio.sleep(0)
+    asyncio.run(run())
+    
+    assert disconnected == ["CP1"]
+    assert "CP1" not in handler.charger_connections
+    assert handler.charger_writer_tasks == {}
+    assert handler.stats["connections_active"] == 0
+
+def test_transaction_ids_continue_from_the_stored_maximum(handler, db):
+    db.add(Charger(id="CP1"))
+    db.add_all([Session(charger_id="CP1", transaction_id=41), Session(charger_id="CP1", transaction_id=7)])
+    db.commit()
+    
+    async def run():
+        # Concurrent StartTransactions may each read the seed, but never repeat an ID
+        return await asyncio.gather(*(handler.next_transaction_id("CP1") for _ in range(3)))
+    
+    assert sorted(asyncio.run(run())) == [42, 43, 44]
+
+def test_failed_transaction_seed_is_read_again(handler, db, monkeypatch):
+    db.add(Charger(id="CP1"))
+    db.add(Session(charger_id="CP1", transaction_id=41))
+    db.commit()
+    load_last_transaction_id = handler.load_last_transaction_id
+    calls = []
+    
+    def flaky_load(charger_id):
+        calls.append(charger_id)
+        if len(calls) == 1:
+            raise OperationalError("SELECT sessions", {}, Exception("database is locked"))
+        return load_last_transaction_id(charger_id)
+    
+    monkeypatch.setattr(handler, "load_last_transaction_id", flaky_load)
+    
+    with pytest.raises(OperationalError):
+        asyncio.run(handler.next_transaction_id("CP1"))
+    assert asyncio.run(handler.next_transaction_id("CP1")) == 42
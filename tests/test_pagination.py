@@ -0,0 +1,73 @@
+"""
+Keyset pagination: cursor encoding and the X-Next-Cursor header on list endpoints
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from app.models.database import RFIDCard, User
+
+def add_cards(db, created_ats):
+    cards = [RFIDCard(id_tag=f"TAG{i}", created_at=created_at) for i, created_at in enumerate(created_ats)]
+    db.add_all(cards)
+    db.commit()
+    return [card.id for card in cards]
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 3, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+def test_no_cursor_for_null_created_at():
+    assert encode_cursor(None, 42) is None
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_missing_cursor_decodes_to_none(cursor):
+    assert decode_cursor(cursor) is None
+
+@pytest.mark.parametrize("cursor", ["garbage", "_42", "not-a-date_42", "2025-03-01T12:30:15_abc"])
+def test_malformed_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(cursor)
+    assert exc_info.value.status_code == 400
+
+def test_pages_follow_next_cursor(client, db):
+    start = datetime(2025, 3, 1, 12, 0, 0)
+    # Two cards share a timestamp so a page boundary falls between equal created_at values
+    ids = add_cards(db, [start, start + timedelta(minutes=1), start + timedelta(minutes=1), start + timedelta(minutes=2), start + timedelta(minutes=3)])
+    
+    seen = []
+    response = client.get("/api/rfid-cards", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen.extend(card["id"] for card in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+        response = client.get("/api/rfid-cards", params={"limit": 2, "cursor": cursor})
+    
+    assert seen == [ids[4], ids[3], ids[2], ids[1], ids[0]]
+
+def test_bad_cursor_is_400(client, db):
+    response = client.get("/api/rfid-cards", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+def test_full_page_ending_in_null_created_at_has_no_cursor(client, db):
+    add_cards(db, [datetime(2025, 3, 1, 12, 0, 0), datetime(2025, 3, 1, 12, 1, 0)])
+    db.query(RFIDCard).update({RFIDCard.created_at: None}, synchronize_session=False)
+    db.commit()
+    
+    response = client.get("/api/rfid-cards", params={"limit": 2})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+def test_users_page_sets_next_cursor(client, db):
+    db.add_all([User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="x") for i in range(3)])
+    db.commit()
+    
+    response = client.get("/api/users", params={"limit": 2})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    assert decode_cursor(response.headers[NEXT_CURSOR_HEADER])[1] == response.json()[-1]["id"]